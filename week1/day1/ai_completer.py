@@ -1,30 +1,109 @@
 import argparse
-from transformers import pipeline
-import torch
+import os
+import sys
+import time
+from contextlib import ExitStack
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from shared.token_budget import TokenBudget, HFTokenizerAdapter, POLICIES
+from shared.tracing import Tracer
+import completer_daemon
+from engines import ENGINES
+
+class PhaseStreamer:
+    """generate() streamer that timestamps the first generated token"""
+    def __init__(self):
+        self.first_token_at = None
+        self.new_tokens = 0
+        self._prompt_seen = False
+    
+    def put(self, value):
+        if not self._prompt_seen:
+            # generate() pushes the prompt ids first
+            self._prompt_seen = True
+            return
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.new_tokens += 1
+    
+    def end(self):
+        pass
 
 class FreeAITextCompleter:
-    def __init__(self, model_name='gpt2-medium', temperature=0.7):
-        print(f"Loading model: {model_name}")
-        self.generator = pipeline(
-            'text-generation',
-            model=model_name,
-            device=0 if torch.cuda.is_available() else -1  # GPU if available, else CPU
-        )
+    def __init__(self, model_name='gpt2-medium', temperature=0.7, truncation_policy='truncate_head',
+                 max_input_tokens=None, tracer=None, batching=False, max_batch_size=8, engine='eager'):
+        # Heavy imports live here so forwarding to a daemon never pays for them
+        from transformers import pipeline
+        import torch
+        
+        if batching and engine == 'onnx':
+            raise ValueError("Continuous batching needs the eager or compiled engine")
+        
+        self.tracer = tracer or Tracer(enabled=False)
+        self.engine = engine
+        print(f"Loading model: {model_name} ({engine})")
+        if engine == 'eager':
+            self.generator = pipeline(
+                'text-generation',
+                model=model_name,
+                device=0 if torch.cuda.is_available() else -1  # GPU if available, else CPU
+            )
+        else:
+            from engines import load_model
+            model, tokenizer = load_model(model_name, engine)
+            # ONNX Runtime places the exported model through its execution provider
+            device = {} if engine == 'onnx' else {'device': 0 if torch.cuda.is_available() else -1}
+            self.generator = pipeline('text-generation', model=model, tokenizer=tokenizer, **device)
         self.temperature = temperature
+        self.token_budget = TokenBudget(
+            context_size=self.generator.model.config.max_position_embeddings,
+            policy=truncation_policy,
+            compact=False,
+            max_input_tokens=max_input_tokens,
+            tokenizer=HFTokenizerAdapter(self.generator.tokenizer)
+        )
+        # Continuous batching lets concurrent callers (e.g. the daemon) share decode steps
+        self.batcher = None
+        if batching:
+            from batching import ContinuousBatcher
+            self.batcher = ContinuousBatcher(self.generator.model, self.generator.tokenizer,
+                                             max_batch_size=max_batch_size, tracer=self.tracer)
     
-    def complete_text(self, prompt, max_tokens=100, temperature=None):
+    def complete_text(self, prompt, max_tokens=100, temperature=None, include_prompt=True):
+        """Generated continuation, prefixed by the prompt as actually sent
+        (which the token budget may have truncated) unless include_prompt is False"""
+        with self.tracer.span('complete_text'):
+            return self._complete_text(prompt, max_tokens, temperature, include_prompt)
+    
+    def _complete_text(self, prompt, max_tokens, temperature, include_prompt=True):
         temp = temperature if temperature is not None else self.temperature
         try:
+            with self.tracer.span('tokenization'):
+                prompt, _ = self.token_budget.fit_prompt(prompt, max_tokens)
+            if self.batcher:
+                prompt_ids = self.token_budget.tokenizer.encode(prompt)
+                result = self.batcher.submit(prompt_ids, max_new_tokens=max_tokens, temperature=temp).result()
+                return prompt + result['text'] if include_prompt else result['text']
+            streamer = PhaseStreamer() if self.tracer.enabled else None
+            start = time.perf_counter()
             result = self.generator(
             prompt,
             max_new_tokens=max_tokens,    # number of tokens to generate
             temperature=temp,
             do_sample=True,
             pad_token_id=self.generator.tokenizer.eos_token_id,
-            truncation=True,
-            num_return_sequences=1
+            num_return_sequences=1,
+            return_full_text=include_prompt,
+            streamer=streamer
             )
-            return result[0]['generated_text']
+            end = time.perf_counter()
+            if streamer and streamer.first_token_at:
+                self.tracer.record('prefill', start, streamer.first_token_at)
+                self.tracer.record('decode', streamer.first_token_at, end, tokens=streamer.new_tokens)
+            else:
+                self.tracer.record('prefill', start, end)
+            with self.tracer.span('post_processing'):
+                return result[0]['generated_text']
         except Exception as e:
             return f"Error generating text: {str(e)}"
     
@@ -40,8 +119,7 @@ class FreeAITextCompleter:
                 if not prompt:
                     continue
                 print("AI: ", end="", flush=True)
-                response = self.complete_text(prompt)
-                new_text = response[len(prompt):].strip()
+                new_text = self.complete_text(prompt, include_prompt=False).strip()
                 print(new_text)
                 print("-" * 50)
             except KeyboardInterrupt:
@@ -59,26 +137,86 @@ def main():
                         help='Maximum tokens to generate')
     parser.add_argument('--interactive', action='store_true',
                         help='Run in interactive mode')
+    parser.add_argument('--truncation', choices=POLICIES, default='truncate_head',
+                        help='What to do when the prompt exceeds the context window '
+                             '(default: truncate_head keeps the end of the prompt)')
+    parser.add_argument('--max-input-tokens', type=int, default=None,
+                        help='Cap prompt tokens to bound prefill time')
+    parser.add_argument('--serve', action='store_true',
+                        help='Run as a daemon keeping the model loaded on a Unix socket')
+    parser.add_argument('--socket', type=str, default=None,
+                        help='Daemon socket path (default: per-user, per-model, per-engine path in '
+                             '$XDG_RUNTIME_DIR or /tmp)')
+    parser.add_argument('--no-daemon', action='store_true',
+                        help='Always generate in-process, even if a daemon is running')
+    parser.add_argument('--engine', choices=ENGINES, default='eager',
+                        help='eager: PyTorch as loaded; compiled: torch.compile; onnx: ONNX Runtime export '
+                             '(exports are cached in ~/.cache/ai_completer)')
+    parser.add_argument('--batching', action='store_true',
+                        help='Serve concurrent requests with continuous batching (most useful with --serve)')
+    parser.add_argument('--max-batch-size', type=int, default=8,
+                        help='Most sequences decoded together with --batching')
+    parser.add_argument('--trace', type=str, metavar='DIR',
+                        help='Write per-phase spans to DIR/trace.json (Chrome) and DIR/metrics.prom')
+    parser.add_argument('--profile', type=str, metavar='FILE',
+                        help='Profile generation and write the result to FILE')
+    parser.add_argument('--profile-mode', choices=['sampling', 'cprofile'], default='sampling',
+                        help='sampling: collapsed stacks for flamegraphs; cprofile: pstats file')
 
     args = parser.parse_args()
+    if args.serve and not completer_daemon.UNIX_SOCKETS:
+        parser.error("--serve needs Unix domain sockets, which this platform does not provide")
+    socket_path = args.socket or completer_daemon.default_socket_path(args.model, args.engine)
+    # The daemon fixed these when it started; asking for other values means generating in-process
+    daemon_settings = ('truncation', 'max_input_tokens', 'batching', 'max_batch_size')
+    overridden = any(getattr(args, name) != parser.get_default(name) for name in daemon_settings)
 
+    # Fast path: hand the prompt to a resident daemon if one is listening
+    if (args.prompt and not (args.serve or args.interactive or args.no_daemon
+                             or args.trace or args.profile or overridden)):
+        result = completer_daemon.forward(
+            socket_path, args.prompt,
+            max_tokens=args.max_tokens,
+            temperature=args.temperature
+        )
+        if result is not None:
+            print("Generated text:")
+            print(result)
+            return
+
+    tracer = Tracer(enabled=bool(args.trace))
     completer = FreeAITextCompleter(
         model_name=args.model,
-        temperature=args.temperature
+        temperature=args.temperature,
+        truncation_policy=args.truncation,
+        max_input_tokens=args.max_input_tokens,
+        tracer=tracer,
+        batching=args.batching,
+        max_batch_size=args.max_batch_size,
+        engine=args.engine
     )
 
-    if args.interactive:
-        completer.interactive_mode()
-    elif args.prompt:
-        result = completer.complete_text(
-            args.prompt,
-            max_tokens=args.max_tokens,
-            temperature=args.temperature
-        )
-        print("Generated text:")
-        print(result)
-    else:
-        parser.print_help()
+    with ExitStack() as stack:
+        if args.profile:
+            stack.enter_context(tracer.profile(args.profile, mode=args.profile_mode))
+        if args.serve:
+            completer_daemon.serve(completer, socket_path)
+        elif args.interactive:
+            completer.interactive_mode()
+        elif args.prompt:
+            result = completer.complete_text(
+                args.prompt,
+                max_tokens=args.max_tokens,
+                temperature=args.temperature
+            )
+            print("Generated text:")
+            print(result)
+        else:
+            parser.print_help()
+
+    if args.trace:
+        tracer.export_chrome_trace(os.path.join(args.trace, 'trace.json'))
+        tracer.export_prometheus(os.path.join(args.trace, 'metrics.prom'))
 
 if __name__ == "__main__":
     main()
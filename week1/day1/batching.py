@@ -0,0 +1,266 @@
+"""Continuous (iteration-level) batching for a HuggingFace causal LM
+
+A single background thread owns the model. Every loop iteration admits
+waiting requests (prefilling each one into its own KV cache), then runs
+one decode step for the whole running batch, so new requests join at
+token boundaries and finished sequences leave immediately instead of
+waiting for the longest one, as they would with static batching.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class _Sequence:
+    """One request's state while it is queued or in the running batch"""
+
+    def __init__(self, prompt_ids, max_new_tokens, temperature, top_k, top_p, future):
+        self.prompt_ids = prompt_ids
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_k = top_k
+        self.top_p = top_p
+        self.future = future
+        self.generated = []
+        self.next_token = None
+        self.length = len(prompt_ids)  # tokens held in the KV cache
+        self.submitted_at = time.perf_counter()
+        self.admitted_at = None
+        self.first_token_at = None
+
+
+class ContinuousBatcher:
+    """Serves concurrent generate requests from one model with a shared running batch
+
+    The running batch keeps one KV cache per layer of shape
+    [batch, heads, length, head_dim], left-padded so sequences of different
+    lengths line up; the attention mask hides the padding and position ids
+    carry each sequence's real position. A joining sequence's cache is
+    padded and concatenated in, a finished one's row is dropped, and
+    padding columns no sequence needs any more are trimmed.
+
+    Sampling (temperature, top_k, top_p) is per request; temperature 0 is
+    greedy decoding.
+    """
+
+    def __init__(self, model, tokenizer, max_batch_size=8, tracer=None):
+        import torch
+        self.torch = torch
+        self.model = model
+        self.tokenizer = tokenizer
+        self.eos_token_id = tokenizer.eos_token_id
+        self.max_positions = model.config.max_position_embeddings
+        self.device = model.device
+        self.max_batch_size = max_batch_size
+        self.tracer = tracer
+        self.pending = queue.Queue()
+        self.active = []
+        self.cache = None   # tuple of (key, value) per layer, left-padded
+        self.mask = None    # [batch, length], 1 where the cache holds a real token
+        self._cache_class = None
+        self.stats = {'requests': 0, 'completed': 0, 'steps': 0, 'generated_tokens': 0,
+                      'batch_size_total': 0, 'max_batch_size_seen': 0}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name='continuous-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, prompt_ids, max_new_tokens=100, temperature=0.7, top_k=50, top_p=1.0):
+        """Queue a request; the Future resolves to a dict with 'text' and timings"""
+        future = Future()
+        prompt_ids = list(prompt_ids) or [self.eos_token_id]
+        max_new_tokens = max(1, min(max_new_tokens, self.max_positions - len(prompt_ids)))
+        self.stats['requests'] += 1
+        self.pending.put(_Sequence(prompt_ids, max_new_tokens, temperature, top_k, top_p, future))
+        return future
+
+    def generate(self, prompt, max_new_tokens=100, temperature=0.7, top_k=50, top_p=1.0):
+        """Blocking convenience wrapper: returns only the generated text"""
+        prompt_ids = self.tokenizer.encode(prompt, add_special_tokens=False)
+        return self.submit(prompt_ids, max_new_tokens, temperature, top_k, top_p).result()['text']
+
+    def close(self):
+        """Stop the loop; requests still queued or running fail"""
+        self._stop.set()
+        self._thread.join()
+        while not self.pending.empty():
+            self.active.append(self.pending.get_nowait())
+        for seq in self.active:
+            seq.future.set_exception(RuntimeError("Batcher closed"))
+        self.active, self.cache, self.mask = [], None, None
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['running'] = len(self.active)
+        stats['queued'] = self.pending.qsize()
+        stats['mean_batch_size'] = stats['batch_size_total'] / stats['steps'] if stats['steps'] else 0.0
+        return stats
+
+    def _loop(self):
+        with self.torch.inference_mode():
+            while not self._stop.is_set():
+                if not self.active:
+                    try:
+                        self._admit(self.pending.get(timeout=0.1))
+                    except queue.Empty:
+                        continue
+                while len(self.active) < self.max_batch_size:
+                    try:
+                        self._admit(self.pending.get_nowait())
+                    except queue.Empty:
+                        break
+                if not self.active:
+                    continue
+                try:
+                    self._step()
+                except Exception as e:
+                    # A failed step leaves the shared cache unusable; fail the batch and start clean
+                    for seq in self.active:
+                        seq.future.set_exception(e)
+                    self.active, self.cache, self.mask = [], None, None
+
+    def _record(self, name, start, **attrs):
+        if self.tracer:
+            self.tracer.record(name, start, time.perf_counter(), **attrs)
+
+    def _legacy(self, past_key_values):
+        if hasattr(past_key_values, 'to_legacy_cache'):
+            self._cache_class = type(past_key_values)
+            return past_key_values.to_legacy_cache()
+        return past_key_values
+
+    def _wrap(self, cache):
+        if self._cache_class is not None and hasattr(self._cache_class, 'from_legacy_cache'):
+            return self._cache_class.from_legacy_cache(cache)
+        return cache
+
+    def _admit(self, seq):
+        """Prefill one request and add it to the running batch"""
+        torch = self.torch
+        seq.admitted_at = time.perf_counter()
+        try:
+            input_ids = torch.tensor([seq.prompt_ids], device=self.device)
+            output = self.model(input_ids=input_ids, use_cache=True)
+            past = self._legacy(output.past_key_values)
+            token = self._sample(output.logits[:, -1, :], [seq])[0]
+        except Exception as e:
+            seq.future.set_exception(e)
+            return
+        seq.first_token_at = time.perf_counter()
+        self._record('prefill', seq.admitted_at, tokens=len(seq.prompt_ids))
+        if self._append(seq, token):
+            self._finish(seq)
+            return
+
+        mask = torch.ones(1, seq.length, dtype=torch.long, device=self.device)
+        if self.cache is None:
+            self.cache, self.mask = past, mask
+        else:
+            length = max(self.mask.shape[1], seq.length)
+            self.cache = tuple(
+                (torch.cat([self._pad(k, length), self._pad(new_k, length)]),
+                 torch.cat([self._pad(v, length), self._pad(new_v, length)]))
+                for (k, v), (new_k, new_v) in zip(self.cache, past)
+            )
+            self.mask = torch.cat([self._pad_mask(self.mask, length), self._pad_mask(mask, length)])
+        self.active.append(seq)
+
+    def _pad(self, tensor, length):
+        """Left-pad a [batch, heads, time, dim] cache tensor to length on the time axis"""
+        missing = length - tensor.shape[2]
+        if not missing:
+            return tensor
+        padding = tensor.new_zeros(tensor.shape[0], tensor.shape[1], missing, tensor.shape[3])
+        return self.torch.cat([padding, tensor], dim=2)
+
+    def _pad_mask(self, mask, length):
+        missing = length - mask.shape[1]
+        if not missing:
+            return mask
+        return self.torch.cat([mask.new_zeros(mask.shape[0], missing), mask], dim=1)
+
+    def _step(self):
+        """One decode step for every running sequence"""
+        torch = self.torch
+        start = time.perf_counter()
+        batch = self.active
+        input_ids = torch.tensor([[seq.next_token] for seq in batch], device=self.device)
+        position_ids = torch.tensor([[seq.length] for seq in batch], device=self.device)
+        mask = torch.cat([self.mask, self.mask.new_ones(len(batch), 1)], dim=1)
+        output = self.model(input_ids=input_ids, past_key_values=self._wrap(self.cache),
+                            attention_mask=mask, position_ids=position_ids, use_cache=True)
+        self.cache = self._legacy(output.past_key_values)
+        self.mask = mask
+        tokens = self._sample(output.logits[:, -1, :], batch)
+
+        self.stats['steps'] += 1
+        self.stats['batch_size_total'] += len(batch)
+        self.stats['max_batch_size_seen'] = max(self.stats['max_batch_size_seen'], len(batch))
+        finished = []
+        for row, (seq, token) in enumerate(zip(batch, tokens)):
+            seq.length += 1
+            if self._append(seq, token):
+                finished.append(row)
+        self._record('decode_step', start, batch=len(batch))
+        if finished:
+            self._remove(finished)
+
+    def _append(self, seq, token):
+        """Record a sampled token; True if the sequence is finished"""
+        if token == self.eos_token_id:
+            return True
+        seq.generated.append(token)
+        seq.next_token = token
+        self.stats['generated_tokens'] += 1
+        return len(seq.generated) >= seq.max_new_tokens
+
+    def _remove(self, rows):
+        """Drop finished rows from the batch and trim padding nobody needs"""
+        torch = self.torch
+        for row in rows:
+            self._finish(self.active[row])
+        keep = [row for row in range(len(self.active)) if row not in rows]
+        self.active = [self.active[row] for row in keep]
+        if not keep:
+            self.cache, self.mask = None, None
+            return
+        index = torch.tensor(keep, device=self.device)
+        mask = self.mask.index_select(0, index)
+        first = int(mask.any(dim=0).int().argmax())
+        self.mask = mask[:, first:]
+        self.cache = tuple((k.index_select(0, index)[:, :, first:], v.index_select(0, index)[:, :, first:])
+                           for k, v in self.cache)
+
+    def _finish(self, seq):
+        now = time.perf_counter()
+        self.stats['completed'] += 1
+        seq.future.set_result({
+            'text': self.tokenizer.decode(seq.generated, skip_special_tokens=True),
+            'prompt_tokens': len(seq.prompt_ids),
+            'generated_tokens': len(seq.generated),
+            'queue_time': seq.admitted_at - seq.submitted_at,
+            'time_to_first_token': seq.first_token_at - seq.submitted_at,
+            'latency': now - seq.submitted_at,
+        })
+
+    def _sample(self, logits, batch):
+        """Pick the next token for each row with that request's sampling parameters"""
+        torch = self.torch
+        logits = logits.float()
+        tokens = []
+        for row, seq in zip(logits, batch):
+            if seq.temperature is None or seq.temperature <= 0:
+                tokens.append(int(row.argmax()))
+                continue
+            row = row / seq.temperature
+            if seq.top_k:
+                kth = torch.topk(row, min(seq.top_k, row.shape[-1])).values[-1]
+                row = row.masked_fill(row < kth, float('-inf'))
+            if seq.top_p < 1.0:
+                sorted_logits, order = torch.sort(row, descending=True)
+                probs = torch.softmax(sorted_logits, dim=-1)
+                # Drop tokens once the mass before them already reaches top_p (always keeps the first)
+                drop = (probs.cumsum(dim=-1) - probs) >= seq.top_p
+                row = row.index_fill(0, order[drop], float('-inf'))
+            tokens.append(int(torch.multinomial(torch.softmax(row, dim=-1), 1)))
+        return tokens
@@ -0,0 +1,121 @@
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from shared.stats import percentile
+from ai_completer import FreeAITextCompleter
+from batching import ContinuousBatcher
+
+DEFAULT_PROMPTS = [
+    "The future of artificial intelligence is",
+    "Once upon a time in a small village,",
+    "The most important thing to remember when learning to code is",
+    "Climate change affects farmers because",
+    "Here is a short recipe for tomato soup:",
+    "The history of the printing press begins",
+]
+
+
+def run_level(generate, requests, concurrency):
+    """Closed loop: `concurrency` clients each send their next request as soon as the last returns"""
+    work = queue.Queue()
+    for request in requests:
+        work.put(request)
+    records = []
+    lock = threading.Lock()
+
+    def client():
+        while True:
+            try:
+                prompt, max_tokens = work.get_nowait()
+            except queue.Empty:
+                return
+            start = time.perf_counter()
+            tokens = generate(prompt, max_tokens)
+            with lock:
+                records.append({'latency': time.perf_counter() - start, 'tokens': tokens,
+                                'max_tokens': max_tokens})
+
+    start = time.perf_counter()
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    latencies = [r['latency'] for r in records]
+    short = [r['latency'] for r in records if r['max_tokens'] == min(q[1] for q in requests)]
+    tokens = sum(r['tokens'] for r in records)
+    return {
+        'concurrency': concurrency,
+        'requests': len(records),
+        'wall_time': wall,
+        'tokens_per_sec': tokens / wall if wall else 0.0,
+        'requests_per_sec': len(records) / wall if wall else 0.0,
+        'p50_latency': percentile(latencies, 0.5),
+        'p95_latency': percentile(latencies, 0.95),
+        'short_p50_latency': percentile(short, 0.5),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pipeline vs continuous batching throughput/latency')
+    parser.add_argument('--model', default='gpt2-medium')
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 2, 4, 8])
+    parser.add_argument('--requests', type=int, default=16, help='Requests per concurrency level')
+    parser.add_argument('--max-tokens', nargs='+', type=int, default=[16, 64, 128],
+                        help='Per-request budgets, cycled so short and long requests mix')
+    parser.add_argument('--temperature', type=float, default=0.7)
+    parser.add_argument('--output', help='Write results as JSON')
+    args = parser.parse_args()
+
+    completer = FreeAITextCompleter(model_name=args.model, temperature=args.temperature)
+    tokenizer = completer.generator.tokenizer
+    batcher = ContinuousBatcher(completer.generator.model, tokenizer,
+                                max_batch_size=max(args.concurrency))
+    # One pipeline call at a time, as the daemon serves it
+    pipeline_lock = threading.Lock()
+
+    def pipeline_generate(prompt, max_tokens):
+        with pipeline_lock:
+            text = completer.complete_text(prompt, max_tokens=max_tokens, include_prompt=False)
+        return len(tokenizer.encode(text))
+
+    def batched_generate(prompt, max_tokens):
+        prompt_ids = tokenizer.encode(prompt)
+        return batcher.submit(prompt_ids, max_tokens, args.temperature).result()['generated_tokens']
+
+    requests = [(DEFAULT_PROMPTS[i % len(DEFAULT_PROMPTS)], args.max_tokens[i % len(args.max_tokens)])
+                for i in range(args.requests)]
+    # Warm up both paths so first-call allocation is not measured
+    pipeline_generate(requests[0][0], 4)
+    batched_generate(requests[0][0], 4)
+
+    results = []
+    for concurrency in args.concurrency:
+        for engine, generate in (('pipeline', pipeline_generate), ('continuous', batched_generate)):
+            print(f"⏱️ {engine} at concurrency {concurrency}...")
+            result = run_level(generate, requests, concurrency)
+            result['engine'] = engine
+            results.append(result)
+    batcher.close()
+
+    print(f"\n{'engine':<12}{'conc':>5}{'tok/s':>9}{'req/s':>8}{'p50 s':>8}{'p95 s':>8}{'short p50':>11}")
+    for r in results:
+        print(f"{r['engine']:<12}{r['concurrency']:>5}{r['tokens_per_sec']:>9.1f}{r['requests_per_sec']:>8.2f}"
+              f"{r['p50_latency']:>8.2f}{r['p95_latency']:>8.2f}{r['short_p50_latency']:>11.2f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'model': args.model, 'config': vars(args), 'results': results}, f, indent=2)
+        print(f"💾 Benchmark saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import argparse
+import json
+import time
+
+from engines import ENGINES, load_model, parity_check, benchmark
+from benchmark_batching import DEFAULT_PROMPTS
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parity check and tokens/sec for eager, compiled and ONNX engines')
+    parser.add_argument('--model', default='gpt2-medium')
+    parser.add_argument('--engines', nargs='+', choices=ENGINES, default=list(ENGINES))
+    parser.add_argument('--new-tokens', type=int, default=64, help='Tokens generated per benchmark run')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--atol', type=float, default=1e-2, help='Max allowed next-token logit difference')
+    parser.add_argument('--output', help='Write results as JSON')
+    args = parser.parse_args()
+
+    prompts = DEFAULT_PROMPTS[:3]
+    reference, tokenizer = load_model(args.model, 'eager')
+
+    results = []
+    for engine in args.engines:
+        print(f"\n⚙️ {engine}")
+        load_start = time.time()
+        model, _ = (reference, tokenizer) if engine == 'eager' else load_model(args.model, engine)
+        load_time = time.time() - load_start
+
+        parity = parity_check(reference, model, tokenizer, prompts, atol=args.atol) if engine != 'eager' else None
+        if parity:
+            status = '✅' if parity['passed'] else '❌'
+            print(f"   {status} parity: max logit diff {parity['max_logit_diff']:.2e}, "
+                  f"greedy match {parity['greedy_matches']}/{parity['prompts']}")
+        result = benchmark(model, tokenizer, prompts, args.new_tokens, args.repeats)
+        result.update({'engine': engine, 'load_time': load_time, 'parity': parity})
+        results.append(result)
+        print(f"   {result['tokens_per_sec']:.1f} tok/s ({result['ms_per_token']:.1f} ms/token)")
+
+    baseline = next((r['tokens_per_sec'] for r in results if r['engine'] == 'eager'), None)
+    print(f"\n{'engine':<10}{'load s':>8}{'warmup s':>10}{'tok/s':>9}{'ms/tok':>8}{'speedup':>9}{'parity':>8}")
+    for r in results:
+        speedup = f"{r['tokens_per_sec'] / baseline:.2f}x" if baseline else '-'
+        parity = '-' if r['parity'] is None else ('pass' if r['parity']['passed'] else 'FAIL')
+        print(f"{r['engine']:<10}{r['load_time']:>8.1f}{r['warmup_time']:>10.1f}{r['tokens_per_sec']:>9.1f}"
+              f"{r['ms_per_token']:>8.1f}{speedup:>9}{parity:>8}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'model': args.model, 'config': vars(args), 'results': results}, f, indent=2)
+        print(f"💾 Benchmark saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
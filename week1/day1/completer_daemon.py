@@ -0,0 +1,143 @@
+"""Unix-socket daemon that keeps a FreeAITextCompleter model resident
+
+Protocol: one JSON object per line. The client sends
+{"prompt": ..., "max_tokens": ..., "temperature": ...} and receives
+{"generated_text": ...} or {"error": ...}. This module only uses the
+standard library so forwarding a prompt never imports torch. It imports
+everywhere; on platforms without Unix sockets (Windows) forwarding is a
+no-op and serve() refuses to start.
+"""
+import getpass
+import json
+import os
+import re
+import signal
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+from contextlib import nullcontext
+
+CONNECT_TIMEOUT = 0.2
+UNIX_SOCKETS = hasattr(socket, 'AF_UNIX') and hasattr(socketserver, 'UnixStreamServer')
+
+
+def _user_id():
+    if hasattr(os, 'getuid'):
+        return str(os.getuid())
+    try:
+        return re.sub(r'[^A-Za-z0-9_.-]', '_', getpass.getuser())
+    except Exception:
+        return 'user'
+
+
+def default_socket_path(model_name, engine='eager'):
+    """Per-user, per-model, per-engine socket path so each combination gets its own daemon"""
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    safe_model = re.sub(r'[^A-Za-z0-9_.-]', '_', model_name)
+    return os.path.join(runtime_dir, f"ai_completer-{_user_id()}-{safe_model}-{engine}.sock")
+
+
+def forward(socket_path, prompt, max_tokens, temperature, timeout=None):
+    """Send a prompt to a running daemon; returns None if no daemon is listening"""
+    if not UNIX_SOCKETS or not os.path.exists(socket_path):
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.settimeout(CONNECT_TIMEOUT)
+        try:
+            client.connect(socket_path)
+        except (ConnectionRefusedError, FileNotFoundError, socket.timeout):
+            return None
+        client.settimeout(timeout)
+        request = {'prompt': prompt, 'max_tokens': max_tokens, 'temperature': temperature}
+        client.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        reader = client.makefile('rb')
+        line = reader.readline()
+        if not line:
+            return None
+        response = json.loads(line)
+    finally:
+        client.close()
+    if 'error' in response:
+        return f"Error generating text: {response['error']}"
+    return response['generated_text']
+
+
+class _CompletionHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            request = json.loads(line)
+            with self.server.generation_lock:
+                text = self.server.completer.complete_text(
+                    request['prompt'],
+                    max_tokens=request.get('max_tokens', 100),
+                    temperature=request.get('temperature')
+                )
+            response = {'generated_text': text}
+        except Exception as e:
+            response = {'error': str(e)}
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+def _make_server(socket_path, completer):
+    """Built on call, not at import: UnixStreamServer does not exist on Windows"""
+
+    class CompletionServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        """Accepts connections concurrently; generation is serialized unless the
+        completer batches concurrent requests itself"""
+        daemon_threads = True
+
+        def __init__(self):
+            self.completer = completer
+            self.generation_lock = nullcontext() if getattr(completer, 'batcher', None) else threading.Lock()
+            super().__init__(socket_path, _CompletionHandler)
+
+    return CompletionServer()
+
+
+def _remove_stale_socket(socket_path):
+    if not os.path.exists(socket_path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.unlink(socket_path)
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"A daemon is already listening on {socket_path}")
+
+
+def serve(completer, socket_path):
+    """Serve completions on socket_path until interrupted"""
+    if not UNIX_SOCKETS:
+        raise RuntimeError("The completion daemon needs Unix domain sockets, which this platform "
+                           "does not provide; run without --serve")
+    _remove_stale_socket(socket_path)
+    # Create the socket owner-only from the start; a chmod after bind leaves a window
+    old_umask = os.umask(0o177)
+    try:
+        server = _make_server(socket_path, completer)
+    finally:
+        os.umask(old_umask)
+
+    def _shutdown(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    print(f"🛰️ Serving completions on {socket_path} (Ctrl+C to stop)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        print("👋 Daemon stopped", file=sys.stderr)
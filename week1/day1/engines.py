@@ -0,0 +1,152 @@
+"""Inference engines for FreeAITextCompleter
+
+eager    - the HF model as loaded (the original pipeline path)
+compiled - the model's forward wrapped in torch.compile; Inductor's FX
+           graph cache keeps compiled kernels on disk between runs
+onnx     - the model exported to ONNX with KV-cache inputs and run by ONNX
+           Runtime through Optimum; the export is saved on disk
+
+Artifacts live under ~/.cache/ai_completer/<model>/<revision>/<engine>/<versions>
+so a new model revision or library version triggers a fresh export.
+"""
+import glob
+import os
+import re
+import time
+
+ENGINES = ('eager', 'compiled', 'onnx')
+DEFAULT_CACHE_DIR = os.path.join('~', '.cache', 'ai_completer')
+
+
+def artifact_dir(model_name, engine, cache_dir=None):
+    """Cache directory for one model revision, engine and library version"""
+    import transformers
+    from transformers import AutoConfig
+
+    revision = getattr(AutoConfig.from_pretrained(model_name), '_commit_hash', None) or 'local'
+    if engine == 'onnx':
+        import onnxruntime
+        versions = f"transformers-{transformers.__version__}-onnxruntime-{onnxruntime.__version__}"
+    else:
+        import torch
+        versions = f"transformers-{transformers.__version__}-torch-{torch.__version__}"
+    safe_model = re.sub(r'[^A-Za-z0-9_.-]', '_', model_name)
+    path = os.path.join(os.path.expanduser(cache_dir or DEFAULT_CACHE_DIR), safe_model, revision[:12],
+                        engine, versions)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def compile_model(model, cache_path):
+    """Wrap model.forward in torch.compile with an on-disk kernel cache"""
+    import torch
+
+    # Read by Inductor whenever it looks up its cache, so setting it before the first call is enough
+    os.environ.setdefault('TORCHINDUCTOR_CACHE_DIR', cache_path)
+    inductor_config = getattr(getattr(torch, '_inductor', None), 'config', None)
+    if inductor_config is not None and hasattr(inductor_config, 'fx_graph_cache'):
+        inductor_config.fx_graph_cache = True
+    # dynamic=True: prompt and KV lengths change every call, avoid recompiling per shape
+    model.forward = torch.compile(model.forward, dynamic=True)
+    return model
+
+
+def export_onnx(model_name, cache_dir=None):
+    """ONNX Runtime model with KV-cache inputs, exported once and reused from disk"""
+    try:
+        from optimum.onnxruntime import ORTModelForCausalLM
+    except ImportError:
+        raise ImportError("The onnx engine needs Optimum with ONNX Runtime: pip install optimum[onnxruntime]")
+
+    path = artifact_dir(model_name, 'onnx', cache_dir)
+    if glob.glob(os.path.join(path, '*.onnx')):
+        print(f"📦 Loading ONNX export from {path}")
+        return ORTModelForCausalLM.from_pretrained(path, use_cache=True, provider='CPUExecutionProvider')
+
+    print(f"🔧 Exporting {model_name} to ONNX (one-time) → {path}")
+    start = time.time()
+    model = ORTModelForCausalLM.from_pretrained(model_name, export=True, use_cache=True,
+                                                provider='CPUExecutionProvider')
+    model.save_pretrained(path)
+    print(f"✅ Export finished in {time.time() - start:.1f}s")
+    return model
+
+
+def load_model(model_name, engine='eager', cache_dir=None):
+    """Return (model, tokenizer) for the chosen engine, ready for pipeline('text-generation')"""
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}', expected one of {ENGINES}")
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    if engine == 'onnx':
+        return export_onnx(model_name, cache_dir), tokenizer
+
+    from transformers import AutoModelForCausalLM
+    model = AutoModelForCausalLM.from_pretrained(model_name)
+    model.eval()
+    if engine == 'compiled':
+        compile_model(model, artifact_dir(model_name, engine, cache_dir))
+    return model, tokenizer
+
+
+def parity_check(reference, candidate, tokenizer, prompts, new_tokens=16, atol=1e-2):
+    """Compare a candidate engine with the eager reference
+
+    Checks next-token logits on each prompt (max absolute difference must
+    be within atol) and whether greedy continuations of new_tokens match.
+    Greedy mismatches alone can come from near-tied logits, so they are
+    reported but only the logit tolerance decides 'passed'.
+    """
+    import torch
+
+    max_diff = 0.0
+    mismatches = []
+    with torch.inference_mode():
+        for prompt in prompts:
+            inputs = tokenizer(prompt, return_tensors='pt')
+            reference_logits = reference(**inputs).logits[:, -1, :].float()
+            candidate_logits = candidate(**inputs).logits[:, -1, :].float()
+            max_diff = max(max_diff, float((reference_logits - candidate_logits).abs().max()))
+
+            generate_kwargs = {'max_new_tokens': new_tokens, 'do_sample': False,
+                               'pad_token_id': tokenizer.eos_token_id}
+            reference_ids = reference.generate(**inputs, **generate_kwargs)[0].tolist()
+            candidate_ids = candidate.generate(**inputs, **generate_kwargs)[0].tolist()
+            if reference_ids != candidate_ids:
+                mismatches.append(prompt)
+    return {
+        'prompts': len(prompts),
+        'max_logit_diff': max_diff,
+        'greedy_matches': len(prompts) - len(mismatches),
+        'greedy_mismatches': mismatches,
+        'passed': max_diff <= atol,
+    }
+
+
+def benchmark(model, tokenizer, prompts, new_tokens=64, repeats=3):
+    """Greedy decode tokens/sec; the first (warm-up) call is timed separately"""
+    import torch
+
+    generate_kwargs = {'max_new_tokens': new_tokens, 'min_new_tokens': new_tokens, 'do_sample': False,
+                       'pad_token_id': tokenizer.eos_token_id}
+    with torch.inference_mode():
+        warmup_start = time.perf_counter()
+        model.generate(**tokenizer(prompts[0], return_tensors='pt'), **generate_kwargs)
+        warmup_time = time.perf_counter() - warmup_start
+
+        times = []
+        for _ in range(repeats):
+            for prompt in prompts:
+                inputs = tokenizer(prompt, return_tensors='pt')
+                start = time.perf_counter()
+                model.generate(**inputs, **generate_kwargs)
+                times.append(time.perf_counter() - start)
+    total_time = sum(times)
+    return {
+        'warmup_time': warmup_time,
+        'runs': len(times),
+        'new_tokens': new_tokens,
+        'tokens_per_sec': len(times) * new_tokens / total_time if total_time else 0.0,
+        'ms_per_token': total_time / (len(times) * new_tokens) * 1000 if times else None,
+    }
@@ -0,0 +1,95 @@
+import json
+import re
+
+DEFAULT_SMALL_MODEL = "Llama-3.2-1B-Instruct-Q4_0.gguf"
+
+
+def check_output(output, rules):
+    """Cheap acceptance check for a small-model answer
+
+    rules (all optional):
+      min_length / max_length  -- bounds on stripped output length in characters
+      required_keywords        -- whole words/phrases looked for case-insensitively
+      min_keyword_hits         -- how many of them must appear (default: all)
+      json                     -- output must parse as JSON
+
+    Returns (passed, reason).
+    """
+    text = output.strip()
+    if len(text) < rules.get('min_length', 1):
+        return False, f"too short ({len(text)} chars)"
+    if 'max_length' in rules and len(text) > rules['max_length']:
+        return False, f"too long ({len(text)} chars)"
+
+    keywords = rules.get('required_keywords') or []
+    if keywords:
+        # Whole-word matches only, so 'hi' is not found inside 'this' or 'which'
+        pattern = re.compile(r"(?<!\w)(?:" + "|".join(re.escape(kw.lower()) for kw in keywords) + r")(?!\w)")
+        hits = set(pattern.findall(text.lower()))
+        needed = rules.get('min_keyword_hits', len(keywords))
+        if len(hits) < needed:
+            return False, f"keywords {len(hits)}/{needed}"
+
+    if rules.get('json'):
+        try:
+            json.loads(text)
+        except ValueError:
+            return False, "invalid JSON"
+
+    return True, "accepted"
+
+
+class CascadeStats:
+    """Acceptance/escalation counts and estimated latency saved per template"""
+
+    def __init__(self):
+        self.templates = {}
+
+    def _entry(self, template_name):
+        return self.templates.setdefault(template_name, {
+            'attempts': 0,
+            'accepted': 0,
+            'escalated': 0,
+            'small_time': 0.0,
+            'wasted_small_time': 0.0,
+            'large_runs': 0,
+            'large_time': 0.0,
+            'escalation_reasons': {},
+        })
+
+    def record_large(self, template_name, execution_time):
+        """Any large-model run; used as the baseline for latency saved"""
+        entry = self._entry(template_name)
+        entry['large_runs'] += 1
+        entry['large_time'] += execution_time
+
+    def record_attempt(self, template_name, small_time, accepted, reason):
+        entry = self._entry(template_name)
+        entry['attempts'] += 1
+        entry['small_time'] += small_time
+        if accepted:
+            entry['accepted'] += 1
+        else:
+            entry['escalated'] += 1
+            entry['wasted_small_time'] += small_time
+            entry['escalation_reasons'][reason] = entry['escalation_reasons'].get(reason, 0) + 1
+
+    def report(self):
+        report = {}
+        for name, entry in self.templates.items():
+            attempts = entry['attempts']
+            avg_large = entry['large_time'] / entry['large_runs'] if entry['large_runs'] else None
+            accepted_small_time = entry['small_time'] - entry['wasted_small_time']
+            saved = None
+            if avg_large is not None:
+                saved = avg_large * entry['accepted'] - accepted_small_time - entry['wasted_small_time']
+            report[name] = {
+                'attempts': attempts,
+                'acceptance_rate': entry['accepted'] / attempts * 100 if attempts else 0.0,
+                'escalation_rate': entry['escalated'] / attempts * 100 if attempts else 0.0,
+                'avg_small_time': entry['small_time'] / attempts if attempts else 0.0,
+                'avg_large_time': avg_large,
+                'estimated_time_saved': saved,
+                'escalation_reasons': dict(entry['escalation_reasons']),
+            }
+        return report
@@ -0,0 +1,228 @@
+import argparse
+import itertools
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from shared.stats import percentile
+
+
+class KeywordMatcher:
+    """Case-insensitive `kw in text` checks for a fixed keyword list
+
+    find() returns the set of keyword indices that occur. The text is
+    lowercased once per call and each keyword is a C-level substring
+    search, which beats a regex or automaton scan for short keyword lists.
+    """
+
+    def __init__(self, keywords):
+        self.keywords = [keyword.lower() for keyword in keywords]
+
+    def find(self, text):
+        lowered = text.lower()
+        return {index for index, keyword in enumerate(self.keywords) if keyword in lowered}
+
+
+class EvalTable:
+    """Columnar result table: one list per column, one row per grid cell"""
+
+    COLUMNS = ['template', 'case', 'temperature', 'max_tokens', 'repeat', 'success',
+               'output', 'execution_time', 'completion_tokens', 'error']
+
+    def __init__(self):
+        self.columns = {name: [] for name in self.COLUMNS}
+
+    def append(self, **row):
+        for name in self.COLUMNS:
+            self.columns[name].append(row.get(name))
+
+    def add_column(self, name, values):
+        self.columns[name] = values
+
+    def __len__(self):
+        return len(self.columns['template'])
+
+    def rows(self):
+        names = list(self.columns)
+        for values in zip(*(self.columns[n] for n in names)):
+            yield dict(zip(names, values))
+
+    def to_dataframe(self):
+        import pandas as pd
+        return pd.DataFrame(self.columns)
+
+
+def score_table(table, cases):
+    """Score every output in bulk and add check columns to the table
+
+    cases maps case name -> dict with optional expected_keywords,
+    min_keyword_hits (default 2, as in test_suite.py), regex, min_length,
+    max_length and json. Keywords are lowercased once per case.
+    """
+    case_matchers = {
+        name: KeywordMatcher(dict.fromkeys(k.lower() for k in case.get('expected_keywords', [])))
+        for name, case in cases.items()
+    }
+    case_regex = {
+        name: re.compile(case['regex'], re.IGNORECASE | re.DOTALL)
+        for name, case in cases.items() if case.get('regex')
+    }
+
+    keyword_hits, checks_passed, failure_reasons = [], [], []
+    for case_name, success, output in zip(table.columns['case'], table.columns['success'],
+                                          table.columns['output']):
+        case = cases[case_name]
+        if not success:
+            keyword_hits.append(0)
+            checks_passed.append(False)
+            failure_reasons.append('generation failed')
+            continue
+
+        text = output or ''
+        wanted = case_matchers[case_name].keywords
+        hits = len(case_matchers[case_name].find(text)) if wanted else 0
+        keyword_hits.append(hits)
+
+        reason = None
+        if wanted and hits < min(case.get('min_keyword_hits', 2), len(wanted)):
+            reason = f"keywords {hits}/{len(wanted)}"
+        elif case_name in case_regex and not case_regex[case_name].search(text):
+            reason = 'regex'
+        elif len(text) < case.get('min_length', 0):
+            reason = 'too short'
+        elif 'max_length' in case and len(text) > case['max_length']:
+            reason = 'too long'
+        elif case.get('json'):
+            try:
+                json.loads(text)
+            except ValueError:
+                reason = 'invalid JSON'
+        checks_passed.append(reason is None)
+        failure_reasons.append(reason)
+
+    table.add_column('keyword_hits', keyword_hits)
+    table.add_column('passed', checks_passed)
+    table.add_column('failure_reason', failure_reasons)
+    return table
+
+
+def summarize_table(table):
+    """Per-cell (template x temperature x max_tokens) pass rate and latency"""
+    cells = {}
+    for row in table.rows():
+        key = (row['template'], row['temperature'], row['max_tokens'])
+        cell = cells.setdefault(key, {'runs': 0, 'passed': 0, 'errors': 0, 'times': []})
+        cell['runs'] += 1
+        cell['passed'] += 1 if row.get('passed') else 0
+        if row['success']:
+            cell['times'].append(row['execution_time'])
+        else:
+            cell['errors'] += 1
+
+    summary = []
+    for (template, temperature, max_tokens), cell in sorted(cells.items(), key=lambda kv: str(kv[0])):
+        times = cell['times']
+        summary.append({
+            'template': template,
+            'temperature': temperature,
+            'max_tokens': max_tokens,
+            'runs': cell['runs'],
+            'pass_rate': cell['passed'] / cell['runs'] * 100,
+            'errors': cell['errors'],
+            'avg_time': sum(times) / len(times) if times else None,
+            'p50_time': percentile(times, 0.5),
+            'p95_time': percentile(times, 0.95),
+        })
+    return summary
+
+
+class EvalGrid:
+    """Runs templates x inputs x sampling parameters through a PromptManager"""
+
+    def __init__(self, manager, **execute_kwargs):
+        self.manager = manager
+        # extra execute_prompt arguments, e.g. cascade=False to pin the large model
+        self.execute_kwargs = execute_kwargs
+
+    def run(self, templates, cases, temperatures=(None,), max_tokens=(None,), repeats=1):
+        """Generate every cell, then score and summarize in bulk
+
+        cases: list of dicts with 'name' and 'input' plus the check fields
+        accepted by score_table. None in a parameter list means the
+        template's optimal value.
+        """
+        cases_by_name = {case['name']: case for case in cases}
+        table = EvalTable()
+        grid = list(itertools.product(templates, cases, temperatures, max_tokens, range(repeats)))
+        print(f"\n🧮 Evaluation grid: {len(grid)} cells")
+
+        for i, (template, case, temperature, tokens, repeat) in enumerate(grid, 1):
+            result = self.manager.execute_prompt(template, case['input'], temperature=temperature,
+                                                 max_tokens=tokens, use_cache=False, **self.execute_kwargs)
+            table.append(
+                template=template,
+                case=case['name'],
+                temperature=result.get('temperature', temperature),
+                max_tokens=result.get('requested_max_tokens', tokens),
+                repeat=repeat,
+                success=bool(result.get('success')),
+                output=result.get('output'),
+                execution_time=result.get('execution_time'),
+                completion_tokens=result.get('generated_tokens', result.get('estimated_completion_tokens')),
+                error=result.get('error'),
+            )
+            if i % 10 == 0 or i == len(grid):
+                print(f"   {i}/{len(grid)} cells generated")
+            self.manager.throttle.wait()
+
+        score_start = time.time()
+        score_table(table, cases_by_name)
+        print(f"🎯 Scored {len(table)} outputs in {(time.time() - score_start) * 1000:.1f}ms")
+        return table, summarize_table(table)
+
+    def save(self, table, summary, results_dir='results'):
+        run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = os.path.join(results_dir, f"eval_grid_{run_id}.json")
+        with open(filename, 'w') as f:
+            json.dump({'run_id': run_id, 'summary': summary, 'columns': table.columns}, f, indent=2)
+        print(f"💾 Evaluation saved to {filename}")
+        return filename
+
+
+def print_summary(summary):
+    print(f"\n📊 {'template':<26}{'temp':>6}{'tokens':>8}{'runs':>6}{'pass%':>8}{'avg s':>8}{'p95 s':>8}")
+    for cell in summary:
+        avg = f"{cell['avg_time']:.2f}" if cell['avg_time'] is not None else '-'
+        p95 = f"{cell['p95_time']:.2f}" if cell['p95_time'] is not None else '-'
+        print(f"   {cell['template']:<26}{cell['temperature']!s:>6}{cell['max_tokens']!s:>8}"
+              f"{cell['runs']:>6}{cell['pass_rate']:>8.1f}{avg:>8}{p95:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a template x input x parameter evaluation grid')
+    parser.add_argument('--cases', required=True,
+                        help='JSONL file: one {"name", "input", "expected_keywords", ...} per line')
+    parser.add_argument('--templates', nargs='+', required=True, help='Template names to evaluate')
+    parser.add_argument('--temperatures', nargs='+', type=float, default=[None])
+    parser.add_argument('--max-tokens', nargs='+', type=int, default=[None])
+    parser.add_argument('--repeats', type=int, default=1)
+    args = parser.parse_args()
+
+    from prompt_manager import PromptManager
+
+    with open(args.cases, 'r') as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+
+    manager = PromptManager()
+    grid = EvalGrid(manager)
+    table, summary = grid.run(args.templates, cases, args.temperatures, args.max_tokens, args.repeats)
+    print_summary(summary)
+    grid.save(table, summary)
+
+
+if __name__ == "__main__":
+    main()
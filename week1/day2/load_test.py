@@ -0,0 +1,289 @@
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from shared.stats import percentile
+
+
+def load_traffic(paths, default_template=None):
+    """Read recorded requests as {'template', 'input', 'recorded_time'} dicts
+
+    Accepts the lab's prompt_experiments_*.json, PromptManager's
+    results/local_comparison_*.json and JSONL files with one
+    {"template", "input"} object per line. Globs are expanded.
+    """
+    requests = []
+    for pattern in paths:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            if path.endswith('.jsonl'):
+                with open(path, 'r') as f:
+                    for line in f:
+                        if line.strip():
+                            record = json.loads(line)
+                            requests.append({
+                                'template': record.get('template', default_template),
+                                'input': record.get('input') or record.get('prompt'),
+                                'recorded_time': record.get('execution_time'),
+                            })
+                continue
+
+            with open(path, 'r') as f:
+                data = json.load(f)
+            if isinstance(data, list):
+                # Lab experiments: raw prompts, no template
+                for record in data:
+                    requests.append({
+                        'template': default_template,
+                        'input': record['prompt'],
+                        'recorded_time': record.get('execution_time'),
+                    })
+            elif 'results' in data:
+                # PromptManager comparison: one input, several templates
+                for template_name, result in data['results'].items():
+                    requests.append({
+                        'template': template_name,
+                        'input': data['input_text'],
+                        'recorded_time': result.get('execution_time'),
+                    })
+    missing = [r for r in requests if not r['template']]
+    if missing:
+        raise ValueError(f"{len(missing)} requests have no template; pass --template")
+    return requests
+
+
+def arrival_times(count, rate, process='poisson', seed=None):
+    """Scheduled send offsets (seconds) for an open-loop run"""
+    rng = random.Random(seed)
+    times = []
+    t = 0.0
+    for _ in range(count):
+        times.append(t)
+        t += rng.expovariate(rate) if process == 'poisson' else 1.0 / rate
+    return times
+
+
+class ManagerBackend:
+    """Sends requests through an in-process PromptManager"""
+
+    def __init__(self, manager):
+        self.manager = manager
+
+    def __call__(self, request):
+        result = self.manager.execute_prompt(request['template'], request['input'], use_cache=False)
+        if not result.get('success'):
+            raise RuntimeError(result.get('error', 'unknown error'))
+        return result
+
+
+class DaemonBackend:
+    """Forwards requests to a running ai_completer --serve daemon"""
+
+    def __init__(self, socket_path=None, model_name='gpt2-medium', max_tokens=100, temperature=0.7, engine='eager'):
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'day1'))
+        import completer_daemon
+        self.forward = completer_daemon.forward
+        self.socket_path = socket_path or completer_daemon.default_socket_path(model_name, engine)
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+
+    def __call__(self, request):
+        text = self.forward(self.socket_path, request['input'], self.max_tokens, self.temperature)
+        if text is None:
+            raise RuntimeError(f"No daemon listening on {self.socket_path}")
+        if text.startswith("Error generating text:"):
+            raise RuntimeError(text)
+        return {'output': text}
+
+
+class StubBackend:
+    """Model-free backend for exercising the harness and queueing behaviour
+
+    Service time is the request's recorded execution_time times scale when
+    available, else exponentially distributed around mean_latency.
+    parallelism bounds how many requests are "generating" at once, like a
+    single model instance (1) or a pool of replicas.
+    """
+
+    def __init__(self, mean_latency=1.0, scale=1.0, parallelism=1, error_rate=0.0, seed=None):
+        self.mean_latency = mean_latency
+        self.scale = scale
+        self.error_rate = error_rate
+        self.slots = threading.Semaphore(parallelism)
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+
+    def __call__(self, request):
+        with self.rng_lock:
+            service_time = (request['recorded_time'] * self.scale if request.get('recorded_time')
+                            else self.rng.expovariate(1.0 / self.mean_latency))
+            fail = self.rng.random() < self.error_rate
+        with self.slots:
+            time.sleep(service_time)
+        if fail:
+            raise RuntimeError("stub error")
+        return {'output': 'stub', 'service_time': service_time}
+
+
+class LoadGenerator:
+    """Open-loop replay: requests are sent on schedule whether or not earlier ones finished"""
+
+    def __init__(self, backend, max_in_flight=64):
+        self.backend = backend
+        self.max_in_flight = max_in_flight
+
+    def _execute(self, request, scheduled, origin, record):
+        started = time.perf_counter() - origin
+        error = None
+        response = {}
+        try:
+            response = self.backend(request)
+        except Exception as e:
+            error = str(e)
+        end = time.perf_counter() - origin
+        # Backends that know their pure service time let us count waiting
+        # for the model as queueing too, not just waiting for dispatch
+        queue_delay = started - scheduled
+        if response.get('service_time') is not None:
+            queue_delay = max(end - scheduled - response['service_time'], queue_delay)
+        record.update({
+            'queue_delay': queue_delay,
+            'end': end,
+            'error': error,
+            'latency': end - scheduled,
+        })
+
+    def run(self, requests, rate, duration=None, process='poisson', seed=None):
+        count = len(requests) if duration is None else int(rate * duration * 1.5) + 1
+        schedule = arrival_times(count, rate, process, seed)
+        if duration is not None:
+            schedule = [t for t in schedule if t < duration]
+        print(f"\n🚦 Open-loop run: {len(schedule)} requests at {rate} req/s ({process})")
+
+        records = []
+        origin = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            for i, scheduled in enumerate(schedule):
+                delay = scheduled - (time.perf_counter() - origin)
+                if delay > 0:
+                    time.sleep(delay)
+                request = requests[i % len(requests)]
+                record = {'scheduled': scheduled, 'template': request['template']}
+                records.append(record)
+                executor.submit(self._execute, request, scheduled, origin, record)
+        return records
+
+
+def build_report(records, window=5.0):
+    """Latency CDF, throughput, queueing delay and error rate, overall and per window"""
+    completed = [r for r in records if 'end' in r]
+    ok = [r for r in completed if not r['error']]
+    latencies = [r['latency'] for r in ok]
+    span = max((r['end'] for r in completed), default=0.0)
+
+    cdf = [{'percentile': p, 'latency': percentile(latencies, p / 100)}
+           for p in (10, 25, 50, 75, 90, 95, 99, 99.9)] if latencies else []
+
+    windows = []
+    if completed:
+        for start in range(0, int(span // window) + 1):
+            lo, hi = start * window, (start + 1) * window
+            arrived = [r for r in records if lo <= r['scheduled'] < hi]
+            finished = [r for r in completed if lo <= r['end'] < hi]
+            finished_ok = [r['latency'] for r in finished if not r['error']]
+            windows.append({
+                'start': lo,
+                'arrivals': len(arrived),
+                'completions': len(finished),
+                'throughput': len(finished) / window,
+                'errors': sum(1 for r in finished if r['error']),
+                'p50_latency': percentile(finished_ok, 0.5),
+                'p95_latency': percentile(finished_ok, 0.95),
+                'mean_queue_delay': (sum(r['queue_delay'] for r in finished) / len(finished)
+                                     if finished else None),
+            })
+
+    return {
+        'requests': len(records),
+        'completed': len(completed),
+        'errors': len(completed) - len(ok),
+        'error_rate': (len(completed) - len(ok)) / len(completed) * 100 if completed else 0.0,
+        'duration': span,
+        'throughput': len(ok) / span if span else 0.0,
+        'latency_cdf': cdf,
+        'mean_latency': sum(latencies) / len(latencies) if latencies else None,
+        'mean_queue_delay': (sum(r['queue_delay'] for r in completed) / len(completed)
+                             if completed else None),
+        'max_queue_delay': max((r['queue_delay'] for r in completed), default=None),
+        'windows': windows,
+    }
+
+
+def _fmt(value):
+    return f"{value:.2f}" if value is not None else '-'
+
+
+def print_report(report):
+    print(f"\n📈 LOAD TEST REPORT")
+    print(f"Requests: {report['requests']}, completed: {report['completed']}, "
+          f"errors: {report['errors']} ({report['error_rate']:.1f}%)")
+    print(f"Throughput: {report['throughput']:.2f} req/s over {report['duration']:.1f}s")
+    if report['mean_queue_delay'] is not None:
+        print(f"Queueing delay: mean {report['mean_queue_delay']:.3f}s, max {report['max_queue_delay']:.3f}s")
+    for point in report['latency_cdf']:
+        print(f"   p{point['percentile']:<5} {point['latency']:.3f}s")
+    print(f"\n{'t (s)':>7}{'arrive':>8}{'done':>6}{'err':>5}{'p50':>8}{'p95':>8}{'queue':>8}")
+    for w in report['windows']:
+        print(f"{w['start']:>7.0f}{w['arrivals']:>8}{w['completions']:>6}{w['errors']:>5}"
+              f"{_fmt(w['p50_latency']):>8}{_fmt(w['p95_latency']):>8}{_fmt(w['mean_queue_delay']):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Open-loop traffic replay against PromptManager')
+    parser.add_argument('sources', nargs='+',
+                        help='prompt_experiments_*.json, results/local_comparison_*.json or .jsonl files')
+    parser.add_argument('--template', help='Template for sources that do not record one')
+    parser.add_argument('--rate', type=float, default=0.1, help='Mean arrival rate (requests/second)')
+    parser.add_argument('--process', choices=['poisson', 'fixed'], default='poisson')
+    parser.add_argument('--duration', type=float, help='Run length in seconds (default: one pass over the traffic)')
+    parser.add_argument('--backend', choices=['manager', 'daemon', 'stub'], default='manager')
+    parser.add_argument('--socket', help='Daemon socket path for --backend daemon')
+    parser.add_argument('--stub-latency', type=float, default=1.0, help='Mean stub service time (s)')
+    parser.add_argument('--stub-scale', type=float, default=1.0, help='Multiplier on recorded execution times')
+    parser.add_argument('--stub-parallelism', type=int, default=1)
+    parser.add_argument('--max-in-flight', type=int, default=64)
+    parser.add_argument('--window', type=float, default=5.0, help='Time-series window (s)')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    requests = load_traffic(args.sources, args.template)
+    if args.backend == 'stub':
+        backend = StubBackend(args.stub_latency, args.stub_scale, args.stub_parallelism, seed=args.seed)
+    elif args.backend == 'daemon':
+        backend = DaemonBackend(args.socket)
+    else:
+        from prompt_manager import PromptManager
+        backend = ManagerBackend(PromptManager())
+
+    records = LoadGenerator(backend, args.max_in_flight).run(
+        requests, args.rate, args.duration, args.process, args.seed)
+    report = build_report(records, args.window)
+    print_report(report)
+
+    if not os.path.exists('results'):
+        os.makedirs('results')
+    filename = f"results/load_test_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(filename, 'w') as f:
+        json.dump({'config': vars(args), 'report': report, 'records': records}, f, indent=2)
+    print(f"💾 Load test saved to {filename}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import argparse
+import json
+import os
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+
+def print_progress(event):
+    """Default progress sink: one line per finished call"""
+    label = f"level {event['level']}" if event['stage'] == 'reduce' else event['stage']
+    print(f"   {label}: {event['done']}/{event['total']} ({event['elapsed']:.1f}s)")
+
+
+class MapReduceSummarizer:
+    """Summarizes documents too long for one prompt
+
+    The document is split into token-bounded chunks that overlap by
+    overlap_tokens, each chunk is summarized with the template (map), and
+    the partial summaries are packed into groups that fit the context and
+    summarized again, level by level, until one final call covers them all
+    (reduce). Calls in a stage run concurrently on up to `workers` model
+    replicas ('model.gguf', 'model.gguf#1', ...), capped by how many fit in
+    the manager's model memory budget.
+
+    Failed calls are left out of the next level and listed in the result
+    (failed_chunks, failed_reduce), which is then flagged partial. When
+    max_levels is reached the remaining summaries go into one last call;
+    input_truncated reports whether the token budget had to cut it.
+    """
+
+    def __init__(self, manager, workers=1, chunk_tokens=None, overlap_tokens=64, max_levels=4,
+                 on_progress=print_progress):
+        self.manager = manager
+        self.workers = max(1, workers)
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.max_levels = max_levels
+        self.on_progress = on_progress
+
+    @classmethod
+    def from_config(cls, manager, config, **overrides):
+        """Build from the 'long_input' section of config.json"""
+        config = config or {}
+        settings = {
+            'workers': config.get('workers', 1),
+            'chunk_tokens': config.get('chunk_tokens'),
+            'overlap_tokens': config.get('overlap_tokens', 64),
+            'max_levels': config.get('max_levels', 4),
+        }
+        settings.update({k: v for k, v in overrides.items() if v is not None})
+        return cls(manager, **settings)
+
+    def _replicas(self, model_name, cascade=False):
+        """Model names for each worker, limited to the replicas the memory budget allows
+
+        With a cascade each worker also holds its own small-model replica
+        (see PromptManager.small_model_for), so that counts towards its size.
+        """
+        models = self.manager.models
+        workers = self.workers
+        replica_mb = models.estimate_size(model_name)
+        if cascade:
+            replica_mb += models.estimate_size(self.manager.get_small_model_name())
+        if replica_mb:
+            resident = 1 if models.is_loaded(model_name) else 0
+            free = models.budget_mb - models.resident_mb()
+            workers = min(workers, resident + int(free // replica_mb))
+            if workers < self.workers:
+                print(f"⚠️ Memory budget allows {max(workers, 1)} of {self.workers} workers")
+        return [model_name] + [f"{model_name}#{i}" for i in range(1, max(workers, 1))]
+
+    def _run_stage(self, stage, template_name, inputs, replicas, temperature, max_tokens, origin, level=None):
+        """Summarize every input concurrently; returns results in input order"""
+        pool = queue.Queue()
+        for replica in replicas:
+            pool.put(replica)
+
+        def summarize(text):
+            replica = pool.get()
+            try:
+                return self.manager.execute_prompt(template_name, text, temperature=temperature,
+                                                   max_tokens=max_tokens, model=replica)
+            finally:
+                pool.put(replica)
+
+        stage_start = time.time()
+        results = [None] * len(inputs)
+        with self.manager.tracer.span(f'map_reduce.{stage}', calls=len(inputs), level=level):
+            with ThreadPoolExecutor(max_workers=len(replicas)) as executor:
+                futures = {executor.submit(summarize, text): i for i, text in enumerate(inputs)}
+                for done, future in enumerate(as_completed(futures), 1):
+                    results[futures[future]] = future.result()
+                    if self.on_progress:
+                        self.on_progress({'stage': stage, 'level': level, 'done': done, 'total': len(inputs),
+                                          'elapsed': time.time() - origin})
+        timing = {
+            'stage': stage,
+            'level': level,
+            'calls': len(inputs),
+            'failed': sum(1 for r in results if not r.get('success')),
+            'time': time.time() - stage_start,
+        }
+        return results, timing
+
+    def _pack(self, summaries, budget):
+        """Greedily group consecutive summaries so each group fits the input budget"""
+        count = self.manager.token_budget.count
+        groups, current, used = [], [], 0
+        for summary in summaries:
+            tokens = count(summary)
+            if current and used + tokens > budget:
+                groups.append(current)
+                current, used = [], 0
+            current.append(summary)
+            used += tokens
+        if current:
+            groups.append(current)
+        return ["\n\n".join(group) for group in groups]
+
+    def summarize(self, template_name, document, temperature=None, max_tokens=None, reduce_template=None):
+        if template_name not in self.manager.templates:
+            return {'error': f'Template {template_name} not found'}
+        template = self.manager.templates[template_name]
+        reduce_template = reduce_template or template_name
+        tokens = max_tokens if max_tokens is not None else template.optimal_max_tokens
+        budget = self.manager.token_budget
+        origin = time.time()
+        stages = []
+
+        map_budget = budget.available(tokens, budget.overhead(template.system_msg, template.user_template))
+        reducer = self.manager.templates[reduce_template]
+        reduce_budget = budget.available(tokens, budget.overhead(reducer.system_msg, reducer.user_template))
+        chunk_tokens = min(self.chunk_tokens or map_budget, map_budget)
+
+        split_start = time.time()
+        with self.manager.tracer.span('map_reduce.split'):
+            chunks = budget.split(document, chunk_tokens, self.overlap_tokens)
+        stages.append({'stage': 'split', 'level': None, 'calls': 0, 'failed': 0,
+                       'time': time.time() - split_start})
+        cascade = any(self.manager.cascade_rules(t) is not None for t in (template, reducer))
+        replicas = self._replicas(template.preferred_model or self.manager.model_name, cascade)
+        print(f"\n🗜️ Map-reduce {template_name}: {budget.count(document)} tokens → {len(chunks)} chunks "
+              f"of ≤{chunk_tokens} on {len(replicas)} worker(s)")
+
+        results, timing = self._run_stage('map', template_name, chunks, replicas, temperature, tokens, origin)
+        stages.append(timing)
+        summaries = [r['output'] for r in results if r.get('success')]
+        failed_chunks = [i for i, r in enumerate(results) if not r.get('success')]
+        if not summaries:
+            return {'template': template_name, 'success': False, 'stages': stages, 'failed_chunks': failed_chunks,
+                    'error': results[0].get('error', 'every chunk failed') if results else 'empty document'}
+        if failed_chunks:
+            print(f"⚠️ {len(failed_chunks)} of {len(chunks)} chunks failed; the summary will be partial")
+
+        # Reduce level by level until the partial summaries fit one final call
+        level = 0
+        failed_reduce = []
+        input_truncated = False
+        while len(summaries) > 1:
+            level += 1
+            groups = self._pack(summaries, reduce_budget)
+            if len(groups) > 1 and level > self.max_levels:
+                print(f"⚠️ max_levels={self.max_levels} reached with {len(groups)} groups left; "
+                      f"the final reduce input will be truncated to fit")
+            if len(groups) == 1 or level > self.max_levels:
+                groups = ["\n\n".join(summaries)]
+            results, timing = self._run_stage('reduce', reduce_template, groups, replicas, temperature,
+                                              tokens, origin, level)
+            stages.append(timing)
+            summaries = [r['output'] for r in results if r.get('success')]
+            failed_reduce.extend({'level': level, 'group': i} for i, r in enumerate(results) if not r.get('success'))
+            input_truncated = input_truncated or any(r.get('input_truncated') for r in results)
+            if not summaries:
+                return {'template': template_name, 'success': False, 'stages': stages,
+                        'failed_chunks': failed_chunks, 'failed_reduce': failed_reduce,
+                        'error': results[0].get('error', 'reduce failed')}
+
+        return {
+            'template': template_name,
+            'reduce_template': reduce_template,
+            'output': summaries[0],
+            'document_tokens': budget.count(document),
+            'chunks': len(chunks),
+            'chunk_tokens': chunk_tokens,
+            'overlap_tokens': self.overlap_tokens,
+            'levels': level,
+            'workers': len(replicas),
+            'failed_chunks': failed_chunks,
+            'failed_reduce': failed_reduce,
+            'input_truncated': input_truncated,
+            'partial': bool(failed_chunks or failed_reduce or input_truncated),
+            'stages': stages,
+            'execution_time': time.time() - origin,
+            'timestamp': datetime.now().isoformat(),
+            'success': True,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize a long document with parallel map-reduce')
+    parser.add_argument('document', help='Text file to summarize')
+    parser.add_argument('--template', default='summarizer_detailed')
+    parser.add_argument('--reduce-template', help='Template for the reduce levels (default: --template)')
+    parser.add_argument('--workers', type=int, help='Model replicas to run chunks on (default: config)')
+    parser.add_argument('--chunk-tokens', type=int)
+    parser.add_argument('--overlap-tokens', type=int)
+    parser.add_argument('--max-tokens', type=int)
+    args = parser.parse_args()
+
+    from prompt_manager import PromptManager
+
+    with open(args.document, 'r') as f:
+        document = f.read()
+
+    manager = PromptManager()
+    result = manager.summarize_long(args.template, document, max_tokens=args.max_tokens,
+                                    reduce_template=args.reduce_template, workers=args.workers,
+                                    chunk_tokens=args.chunk_tokens, overlap_tokens=args.overlap_tokens)
+    if not result.get('success'):
+        print(f"❌ Error: {result.get('error')}")
+        return
+
+    print(f"\n📝 SUMMARY ({result['chunks']} chunks, {result['levels']} reduce level(s), "
+          f"{result['execution_time']:.1f}s)\n{result['output']}")
+    if result['partial']:
+        print(f"⚠️ Partial summary: failed chunks {result['failed_chunks']}, "
+              f"failed reduce calls {len(result['failed_reduce'])}, input truncated: {result['input_truncated']}")
+    for stage in result['stages']:
+        label = f"reduce {stage['level']}" if stage['stage'] == 'reduce' else stage['stage']
+        print(f"   {label:<10}{stage['calls']:>4} calls {stage['time']:>8.2f}s")
+
+    filename = os.path.join('results', f"map_reduce_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(filename, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"💾 Summary saved to {filename}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,29 @@
 from gpt4all import GPT4All
+import asyncio
 import json
 import time
 import os
+import sys
+import threading
+from contextlib import ExitStack
 from datetime import datetime
 import pandas as pd
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from shared.token_budget import TokenBudget, ContextOverflowError
+from shared.tracing import Tracer, timed_stream
+from shared.deadline import Deadline, RateEstimator
+from shared.throttle import AdaptiveThrottle
+from shared.model_registry import ModelRegistry, ModelBudgetError, base_name
+from semantic_cache import SemanticCache
+from cascade import CascadeStats, check_output, DEFAULT_SMALL_MODEL
+from single_flight import SingleFlight
+from map_reduce import MapReduceSummarizer
+
 class PromptTemplate:
     def __init__(self, name, category, system_msg, user_template, description, 
-                 examples=None, optimal_temperature=0.7, optimal_max_tokens=200):
+                 examples=None, optimal_temperature=0.7, optimal_max_tokens=200, cascade=None,
+                 preferred_model=None):
         self.name = name
         self.category = category
         self.system_msg = system_msg
@@ -16,14 +32,39 @@ class PromptTemplate:
         self.examples = examples or []
         self.optimal_temperature = optimal_temperature
         self.optimal_max_tokens = optimal_max_tokens
+        self.cascade = cascade or {}
+        self.preferred_model = preferred_model
 
 class PromptManager:
-    def __init__(self, model_name="Meta-Llama-3-8B-Instruct.Q4_0.gguf", templates_file="templates.json"):
+    def __init__(self, model_name="Meta-Llama-3-8B-Instruct.Q4_0.gguf", templates_file="templates.json",
+                 config_file="config.json"):
         print(f"🤖 Initializing Local Prompt Manager with {model_name}")
         
+        self.config = self.load_config(config_file)
+        self.token_budget = TokenBudget.from_config(self.config.get('token_budget'))
+        cache_config = self.config.get('semantic_cache', {})
+        self.semantic_cache = SemanticCache.from_config(cache_config) if cache_config.get('enabled') else None
+        self.tracer = Tracer.from_config(self.config.get('tracing'))
+        self.rate_estimator = RateEstimator()
+        self.throttle = AdaptiveThrottle.from_config(self.config.get('performance'))
+        self.cascade_stats = CascadeStats()
+        self.model_name = model_name
+        self.model_locks = {}
+        # Templates may prefer other .gguf files; they share one memory budget
+        self.models = ModelRegistry.from_config(
+            self.config.get('models'),
+            # Never download the cascade's small model mid-request; a missing file just disables it
+            loader=lambda name: GPT4All(name, n_ctx=self.token_budget.context_size,
+                                        allow_download=name != self.get_small_model_name())
+        )
+        self.small_model_error = None
+        self.models.pin(model_name)
+        coalescing_config = self.config.get('coalescing', {})
+        self.single_flight = SingleFlight() if coalescing_config.get('enabled', True) else None
+        
         # Initialize GPT4All model
         try:
-            self.model = GPT4All(model_name)
+            self.model = self.models.get(model_name)
             print(f"✅ Model loaded successfully!")
         except Exception as e:
             print(f"❌ Error loading model: {e}")
@@ -39,6 +80,15 @@ class PromptManager:
         if not os.path.exists('results'):
             os.makedirs('results')
     
+    def load_config(self, config_file):
+        """Load runtime settings from config.json (empty if missing)"""
+        try:
+            with open(config_file, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            print(f"📁 Config file {config_file} not found. Using defaults.")
+            return {}
+    
     def load_templates_from_file(self):
         """Load templates from JSON file"""
         try:
@@ -111,8 +161,114 @@ class PromptManager:
         print(f"✅ Created default templates file: {self.templates_file}")
         self.load_templates_from_file()
     
-    def execute_prompt(self, template_name, user_input, temperature=None, max_tokens=None):
-        """Execute a specific prompt template with local model"""
+    def get_small_model_name(self):
+        return self.config.get('cascade', {}).get('small_model', DEFAULT_SMALL_MODEL)
+    
+    def small_model_for(self, model=None):
+        """Small model for a cascade; a '#i' replica of the large model gets the matching small replica"""
+        small_model = self.get_small_model_name()
+        if model and '#' in model:
+            small_model += model[model.index('#'):]
+        return small_model
+    
+    def model_label(self, model_name):
+        model_name = base_name(model_name)
+        return "Local Llama-3-8B" if model_name == self.model_name else model_name
+    
+    def cascade_rules(self, template, cascade=None):
+        """Acceptance rules if this request should try the small model first, else None"""
+        cascade_config = self.config.get('cascade', {})
+        rules = dict(cascade_config.get('default_checks', {}))
+        rules.update(template.cascade)
+        # Global switch in config.json, per-template opt-out via "enabled": false
+        enabled = rules.pop('enabled', True) and cascade_config.get('enabled', False)
+        if cascade is not None:
+            enabled = cascade
+        return rules if enabled else None
+    
+    def execute_prompt(self, template_name, user_input, temperature=None, max_tokens=None, use_cache=True,
+                       deadline=None, cascade=None, on_token=None, model=None):
+        """Execute a specific prompt template with local model
+        
+        deadline is a latency budget in seconds: max_tokens is lowered to what
+        the measured speeds for this template allow, and generation is cut off
+        (result flagged 'truncated') if the deadline is still reached.
+        
+        cascade overrides the template's cascade setting: when on, the small
+        model answers first and only answers failing the template's
+        acceptance checks are regenerated on the large model.
+        
+        on_token is called with each output piece as it is generated. Identical
+        concurrent requests are coalesced: one generation runs and every
+        caller gets its result (flagged 'coalesced') and token stream.
+        
+        model overrides the template's preferred_model for this call. A replica
+        ('model.gguf#2') also runs the cascade's small attempt on the matching
+        small-model replica, so parallel callers do not queue on one model.
+        """
+        key, run = self._prompt_call(template_name, user_input, temperature, max_tokens, use_cache,
+                                     deadline, cascade, model)
+        with self.tracer.span('execute_prompt', template=template_name):
+            if not self.single_flight:
+                return run(on_token)
+            return self._caller_result(*self.single_flight.do(key, run, on_token))
+    
+    async def execute_prompt_async(self, template_name, user_input, temperature=None, max_tokens=None,
+                                   use_cache=True, deadline=None, cascade=None, on_token=None, model=None):
+        """Awaitable execute_prompt; the generation runs in the default executor
+        
+        Coalescing is shared with execute_prompt, so an async request identical
+        to one in flight (from either entry point) waits for that generation.
+        on_token is called from the executor thread.
+        """
+        key, run = self._prompt_call(template_name, user_input, temperature, max_tokens, use_cache,
+                                     deadline, cascade, model)
+        with self.tracer.span('execute_prompt', template=template_name):
+            if not self.single_flight:
+                return await asyncio.get_running_loop().run_in_executor(None, run, on_token)
+            return self._caller_result(*await self.single_flight.do_async(key, run, on_token))
+    
+    def _prompt_call(self, template_name, user_input, temperature, max_tokens, use_cache, deadline, cascade,
+                     model):
+        """(coalescing key, run(publish)) for one execute_prompt call"""
+        def run(publish):
+            return self._execute_prompt(template_name, user_input, temperature, max_tokens, use_cache,
+                                        Deadline(deadline) if deadline else None, cascade, publish, model)
+        
+        key = (template_name, user_input, temperature, max_tokens, use_cache, deadline, cascade, model)
+        return key, run
+    
+    def _caller_result(self, result, leader):
+        """The leader's result as is; followers get a copy flagged 'coalesced'"""
+        if leader:
+            return result
+        result = dict(result)
+        result['coalesced'] = True
+        self.results_history.append(result)
+        return result
+    
+    def _generate(self, model_name, full_prompt, max_tokens, temp, deadline, on_token=None):
+        """Run one streamed generation; returns (text, tokens, prefill_s, decode_s)"""
+        # Streaming so prefill and decode can be timed apart
+        generate_kwargs = {'callback': deadline.callback} if deadline else {}
+        model_lock = self.model_locks.setdefault(model_name, threading.Lock())
+        # Held for the whole generation so the registry cannot evict the model mid-stream
+        with model_lock, self.models.acquire(model_name) as model, ExitStack() as stack:
+            with self.tracer.span('session_setup'):
+                stack.enter_context(model.chat_session())
+            return timed_stream(self.tracer, model.generate(
+                full_prompt,
+                max_tokens=max_tokens,
+                temp=temp,
+                top_p=0.9,
+                top_k=40,
+                repeat_penalty=1.18,
+                streaming=True,
+                **generate_kwargs
+            ), on_token=on_token)
+    
+    def _execute_prompt(self, template_name, user_input, temperature, max_tokens, use_cache, deadline, cascade,
+                        on_token=None, model=None):
         if template_name not in self.templates:
             return {'error': f'Template {template_name} not found'}
         
@@ -122,26 +278,123 @@ class PromptManager:
         temp = temperature if temperature is not None else template.optimal_temperature
         tokens = max_tokens if max_tokens is not None else template.optimal_max_tokens
         
+        # Serve near-duplicate inputs from the similarity cache
+        cache_namespace = (template_name, temp, tokens)
+        if self.semantic_cache and use_cache:
+            lookup_start = time.time()
+            cached, similarity = self.semantic_cache.lookup(cache_namespace, user_input)
+            if cached is not None:
+                result = dict(cached)
+                result.update({
+                    'input': user_input,
+                    'execution_time': time.time() - lookup_start,
+                    'timestamp': datetime.now().isoformat(),
+                    'cache_hit': True,
+                    'cache_similarity': similarity
+                })
+                if on_token:
+                    on_token(result['output'])
+                self.results_history.append(result)
+                return result
+        
+        # Fit the input into the context window before rendering
+        try:
+            with self.tracer.span('tokenization'):
+                fitted_input, budget_report = self.token_budget.fit(
+                    user_input, tokens,
+                    system_msg=template.system_msg,
+                    user_template=template.user_template
+                )
+        except ContextOverflowError as e:
+            error_result = {
+                'template': template_name,
+                'input': user_input,
+                'error': str(e),
+                'timestamp': datetime.now().isoformat(),
+                'success': False,
+                'model': "Local Llama-3-8B"
+            }
+            self.results_history.append(error_result)
+            return error_result
+        
         # Format the complete prompt for local model
-        user_prompt = template.user_template.format(input=user_input)
-        full_prompt = f"{template.system_msg}\n\n{user_prompt}"
+        with self.tracer.span('template_render'):
+            user_prompt = template.user_template.format(input=fitted_input)
+            full_prompt = f"{template.system_msg}\n\n{user_prompt}"
+        
+        # Shrink the decode budget to what fits the deadline
+        generation_tokens = tokens
+        if deadline:
+            generation_tokens = self.rate_estimator.plan_max_tokens(
+                template_name, budget_report['prompt_tokens'], deadline.time_left(), tokens)
+        
+        rules = self.cascade_rules(template, cascade)
+        cascade_info = None
+        if rules is not None and deadline and generation_tokens < tokens:
+            # The deadline already squeezes the large model; no time for a small attempt first
+            rules = None
+            cascade_info = {'skipped': 'deadline'}
+        if rules is not None and self.small_model_error:
+            rules = None
+            cascade_info = {'skipped': 'small model unavailable'}
+        large_model = model or template.preferred_model or self.model_name
+        model_label = self.model_label(large_model)
         
         try:
             start_time = time.time()
+            generation = None
             
-            # Generate with GPT4All
-            with self.model.chat_session():
-                response = self.model.generate(
-                    full_prompt,
-                    max_tokens=tokens,
-                    temp=temp,
-                    top_p=0.9,
-                    top_k=40,
-                    repeat_penalty=1.18
-                )
+            # Cascade: try the small model, keep its answer if it passes the checks
+            if rules is not None:
+                small_model = self.small_model_for(model)
+                small_start = time.time()
+                try:
+                    small_generation = self._generate(small_model, full_prompt, generation_tokens, temp, deadline)
+                except Exception as e:
+                    # The large model still answers; a small model that cannot load is not retried
+                    small_generation = None
+                    if not isinstance(e, ModelBudgetError) and not self.models.is_loaded(small_model):
+                        self.small_model_error = str(e)
+                    print(f"⚠️ Small model failed, escalating: {e}")
+                small_time = time.time() - small_start
+                if small_generation is None:
+                    accepted, reason = False, 'small model error'
+                else:
+                    with self.tracer.span('cascade_check'):
+                        accepted, reason = check_output(small_generation[0], rules)
+                    self.rate_estimator.update(f"{template_name}@small", budget_report['prompt_tokens'],
+                                               small_generation[2], small_generation[1], small_generation[3])
+                self.cascade_stats.record_attempt(template_name, small_time, accepted, reason)
+                cascade_info = {'accepted': accepted, 'reason': reason, 'small_model_time': small_time}
+                if not accepted and deadline:
+                    if deadline.expired() and small_generation is not None:
+                        # No time left to escalate: return the small answer, flagged truncated below
+                        accepted = True
+                        cascade_info['escalation_skipped'] = 'deadline'
+                    else:
+                        generation_tokens = self.rate_estimator.plan_max_tokens(
+                            template_name, budget_report['prompt_tokens'], deadline.time_left(), tokens)
+                if accepted:
+                    generation = small_generation
+                    if on_token:
+                        on_token(small_generation[0])
+                    model_label = self.model_label(small_model)
+            
+            if generation is None:
+                large_start = time.time()
+                generation = self._generate(large_model, full_prompt, generation_tokens, temp, deadline,
+                                            on_token=on_token)
+                self.cascade_stats.record_large(template_name, time.time() - large_start)
+                self.rate_estimator.update(template_name, budget_report['prompt_tokens'], generation[2],
+                                           generation[1], generation[3])
+            response, generated_tokens, prefill_time, decode_time = generation
             
             execution_time = time.time() - start_time
+            # Cut off by the deadline, or by a max_tokens lowered to meet it
+            truncated = bool(deadline) and (deadline.hit or (generation_tokens < tokens
+                                                             and generated_tokens >= generation_tokens))
             
+            post_start = time.perf_counter()
             # Estimate token usage (approximate for local models)
             estimated_prompt_tokens = len(full_prompt.split()) * 1.3  # Rough approximation
             estimated_completion_tokens = len(response.split()) * 1.3
@@ -154,15 +407,26 @@ class PromptManager:
                 'estimated_tokens': int(estimated_total_tokens),
                 'estimated_prompt_tokens': int(estimated_prompt_tokens),
                 'estimated_completion_tokens': int(estimated_completion_tokens),
+                'generated_tokens': generated_tokens,
                 'execution_time': execution_time,
                 'temperature': temp,
-                'max_tokens': tokens,
+                'max_tokens': generation_tokens,
+                'requested_max_tokens': tokens,
+                'deadline': deadline.seconds if deadline else None,
+                'truncated': truncated,
+                'input_truncated': budget_report['truncated'],
+                'token_budget': budget_report,
+                'cascade': cascade_info,
                 'timestamp': datetime.now().isoformat(),
                 'success': True,
-                'model': "Local Llama-3-8B"
+                'model': model_label
             }
+            self.tracer.record('post_processing', post_start, time.perf_counter())
             
-            self.results_history.append(result)
+            with self.tracer.span('persistence'):
+                if self.semantic_cache and use_cache and not truncated:
+                    self.semantic_cache.store(cache_namespace, user_input, result)
+                self.results_history.append(result)
             return result
             
         except Exception as e:
@@ -172,11 +436,25 @@ class PromptManager:
                 'error': str(e),
                 'timestamp': datetime.now().isoformat(),
                 'success': False,
-                'model': "Local Llama-3-8B"
+                'model': model_label
             }
             self.results_history.append(error_result)
             return error_result
     
+    def summarize_long(self, template_name, document, temperature=None, max_tokens=None, reduce_template=None,
+                       on_progress=None, **overrides):
+        """Summarize a document longer than the context with parallel map-reduce
+        
+        Settings come from the 'long_input' section of config.json; keyword
+        overrides (workers, chunk_tokens, overlap_tokens, max_levels) take
+        precedence. on_progress receives one event per finished call.
+        """
+        if on_progress:
+            overrides['on_progress'] = on_progress
+        summarizer = MapReduceSummarizer.from_config(self, self.config.get('long_input'), **overrides)
+        with self.tracer.span('summarize_long', template=template_name):
+            return summarizer.summarize(template_name, document, temperature, max_tokens, reduce_template)
+    
     def compare_templates(self, template_names, user_input, save_results=True):
         """Compare multiple templates on the same input"""
         results = {}
@@ -197,8 +475,8 @@ class PromptManager:
             else:
                 print(f"❌ Error: {result.get('error', 'Unknown error')}")
             
-            # Small delay to prevent overheating
-            time.sleep(0.5)
+            # Pause only if the machine is overloaded or running hot
+            self.throttle.wait()
         
         if save_results:
             self.save_comparison_results(comparison_id, results, user_input)
@@ -217,11 +495,41 @@ class PromptManager:
             'results': results
         }
         
-        with open(filename, 'w') as f:
-            json.dump(data, f, indent=2)
+        with self.tracer.span('persistence', file=filename):
+            with open(filename, 'w') as f:
+                json.dump(data, f, indent=2)
         
         print(f"💾 Results saved to {filename}")
     
+    def export_trace(self, trace_file='logs/trace.json', metrics_file='logs/metrics.prom'):
+        """Write collected spans as Chrome trace JSON and Prometheus metrics"""
+        if not self.tracer.enabled:
+            print("⚠️ Tracing is disabled (set tracing.enabled in config.json)")
+            return None
+        self.tracer.export_chrome_trace(trace_file)
+        self.tracer.export_prometheus(metrics_file)
+        return self.tracer.summary()
+    
+    def get_cascade_stats(self):
+        """Per-template cascade acceptance/escalation rates and latency saved"""
+        return self.cascade_stats.report()
+    
+    def get_coalescing_stats(self):
+        """How many execute_prompt calls were served by an in-flight duplicate"""
+        if not self.single_flight:
+            return {'message': 'Request coalescing is disabled'}
+        return self.single_flight.get_stats()
+    
+    def get_model_stats(self):
+        """Resident models, their memory footprint, loads and evictions"""
+        return self.models.get_stats()
+    
+    def get_cache_stats(self):
+        """Similarity cache hit/miss statistics"""
+        if not self.semantic_cache:
+            return {'message': 'Semantic cache is disabled'}
+        return self.semantic_cache.get_stats()
+    
     def analyze_performance(self):
         """Analyze performance across all executions"""
         if not self.results_history:
@@ -232,13 +540,18 @@ class PromptManager:
         if not successful_results:
             return {'message': 'No successful executions found'}
         
+        # Coalesced followers carry a copy of the leader's result and timing;
+        # only the generations themselves count towards time and token stats
+        generated_results = [r for r in successful_results if not r.get('coalesced')]
+        
         analysis = {
             'total_executions': len(self.results_history),
             'successful_executions': len(successful_results),
+            'coalesced_executions': len(successful_results) - len(generated_results),
             'success_rate': len(successful_results) / len(self.results_history) * 100,
-            'avg_estimated_tokens': sum(r.get('estimated_tokens', 0) for r in successful_results) / len(successful_results),
-            'avg_execution_time': sum(r.get('execution_time', 0) for r in successful_results) / len(successful_results),
-            'total_estimated_tokens': sum(r.get('estimated_tokens', 0) for r in successful_results),
+            'avg_estimated_tokens': sum(r.get('estimated_tokens', 0) for r in generated_results) / len(generated_results),
+            'avg_execution_time': sum(r.get('execution_time', 0) for r in generated_results) / len(generated_results),
+            'total_estimated_tokens': sum(r.get('estimated_tokens', 0) for r in generated_results),
             'model_used': 'Local Llama-3-8B',
             'template_usage': {},
             'fastest_template': None,
@@ -247,7 +560,7 @@ class PromptManager:
         
         # Template usage statistics
         template_stats = {}
-        for result in successful_results:
+        for result in generated_results:
             template_name = result.get('template', 'unknown')
             if template_name not in template_stats:
                 template_stats[template_name] = {
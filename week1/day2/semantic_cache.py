@@ -0,0 +1,251 @@
+import re
+import time
+import random
+import threading
+from collections import OrderedDict
+
+
+def normalize_text(text):
+    """Lowercase, drop punctuation and collapse whitespace"""
+    text = text.lower()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+_MASK64 = (1 << 64) - 1
+
+
+class MinHasher:
+    """MinHash signatures over character n-gram shingles
+
+    One-permutation hashing: each shingle is hashed once to 64 bits and
+    the hash both picks one of num_perm bins and competes for that bin's
+    minimum, so signing costs one hash per shingle instead of one per
+    shingle and permutation. Empty bins borrow the next filled bin's
+    minimum (with the distance mixed in) so short texts still compare.
+
+    Shingles use Python's built-in (SipHash) string hash, which is salted
+    per process: signatures are only comparable within one process, which
+    is all an in-memory cache needs.
+    """
+
+    def __init__(self, num_perm=64, ngram=4, seed=42):
+        self.num_perm = num_perm
+        self.ngram = ngram
+        self.key = random.Random(seed).getrandbits(64)
+
+    def shingles(self, text):
+        if len(text) <= self.ngram:
+            return {text}
+        return {text[i:i + self.ngram] for i in range(len(text) - self.ngram + 1)}
+
+    def signature(self, text):
+        num_perm = self.num_perm
+        key = self.key
+        bins = [None] * num_perm
+        for shingle_hash in [(hash(shingle) & _MASK64) ^ key for shingle in self.shingles(text)]:
+            value, bin_index = divmod(shingle_hash, num_perm)
+            current = bins[bin_index]
+            if current is None or value < current:
+                bins[bin_index] = value
+        filled = [i for i, value in enumerate(bins) if value is not None]
+        if len(filled) < num_perm:
+            # Rotation densification: an empty bin takes the first filled bin to its right
+            signature = list(bins)
+            for i, value in enumerate(bins):
+                if value is None:
+                    j = next((f for f in filled if f > i), filled[0])
+                    signature[i] = bins[j] * num_perm + (j - i) % num_perm
+            return tuple(signature)
+        return tuple(bins)
+
+
+def same_word_order(text_a, text_b):
+    """True if the words both normalized texts share appear in the same order
+
+    Character shingles ignore word order, so 'from Monday to Wednesday'
+    and 'from Wednesday to Monday' look near-identical; this rejects such
+    reorderings while still allowing inserted, dropped or misspelled words.
+    """
+    words_a, words_b = text_a.split(), text_b.split()
+    common = set(words_a) & set(words_b)
+    return [w for w in words_a if w in common] == [w for w in words_b if w in common]
+
+
+NUMBER_WORDS = frozenset(
+    "zero one two three four five six seven eight nine ten eleven twelve thirteen fourteen fifteen "
+    "sixteen seventeen eighteen nineteen twenty thirty forty fifty sixty seventy eighty ninety "
+    "hundred thousand million billion dozen half first second third fourth fifth sixth seventh "
+    "eighth ninth tenth".split())
+
+
+def fact_tokens(text):
+    """Lowercased words an answer may depend on exactly: anything containing
+    a digit (order numbers, times, amounts), number words, and capitalized
+    words (names, places, days, products)"""
+    return frozenset(word.lower() for word in re.findall(r"\w+", text)
+                     if word[0].isupper() or word.lower() in NUMBER_WORDS
+                     or any(c.isdigit() for c in word))
+
+
+def same_facts(normalized_a, facts_a, normalized_b, facts_b):
+    """True if each text's fact tokens all appear in the other text
+
+    Near-duplicates that swap an order number, a time, a count or a name
+    score above any useful threshold, but need a different answer. Checking
+    membership in the other text's words (not fact sets against each
+    other) keeps pure case changes, like an all-caps copy, a hit.
+    """
+    return facts_a <= set(normalized_b.split()) and facts_b <= set(normalized_a.split())
+
+
+def estimate_similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity from two MinHash signatures"""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+
+class LSHIndex:
+    """Banded LSH index: candidate lookup costs one dict probe per band"""
+
+    def __init__(self, num_perm=64, bands=16, max_entries=None):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be divisible by bands ({bands})")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.buckets = [{} for _ in range(bands)]
+        self._next_id = 0
+
+    def _band_keys(self, signature):
+        return [signature[i * self.rows:(i + 1) * self.rows] for i in range(self.bands)]
+
+    def add(self, signature, value):
+        entry_id = self._next_id
+        self._next_id += 1
+        self.entries[entry_id] = (signature, value)
+        for band, key in zip(self.buckets, self._band_keys(signature)):
+            band.setdefault(key, []).append(entry_id)
+        if self.max_entries and len(self.entries) > self.max_entries:
+            self._evict_oldest()
+        return entry_id
+
+    def _evict_oldest(self):
+        entry_id, (signature, _) = self.entries.popitem(last=False)
+        for band, key in zip(self.buckets, self._band_keys(signature)):
+            ids = band.get(key)
+            if ids:
+                ids.remove(entry_id)
+                if not ids:
+                    del band[key]
+
+    def query(self, signature, accept=None):
+        """Return (similarity, value) of the best candidate, or (0.0, None)
+
+        accept(value), if given, must be true for a candidate to count.
+        """
+        candidates = set()
+        for band, key in zip(self.buckets, self._band_keys(signature)):
+            candidates.update(band.get(key, ()))
+        best_similarity, best_value = 0.0, None
+        for entry_id in candidates:
+            stored_signature, value = self.entries[entry_id]
+            similarity = estimate_similarity(signature, stored_signature)
+            if similarity > best_similarity and (accept is None or accept(value)):
+                best_similarity, best_value = similarity, value
+        return best_similarity, best_value
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SemanticCache:
+    """Near-duplicate response cache, one LSH index per (template, params)
+
+    Inputs are normalized, turned into MinHash signatures and looked up in
+    a banded LSH index, so a lookup touches only the few entries that share
+    a band with the query regardless of how many entries are stored. A hit
+    must also keep the shared words in the same order (same_word_order) and
+    the same numbers and names (same_facts).
+    Lookups and stores are serialized, so concurrent callers are safe.
+    """
+
+    def __init__(self, threshold=0.9, num_perm=64, bands=16, ngram=4, max_entries=100000):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.max_entries = max_entries
+        self.hasher = MinHasher(num_perm=num_perm, ngram=ngram)
+        self.indexes = {}
+        self.lock = threading.Lock()
+        self.stats = {
+            'lookups': 0,
+            'hits': 0,
+            'exact_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'total_hit_similarity': 0.0,
+            'total_lookup_time': 0.0,
+        }
+
+    @classmethod
+    def from_config(cls, config):
+        """Build a cache from the 'semantic_cache' section of config.json"""
+        config = config or {}
+        return cls(
+            threshold=config.get('threshold', 0.9),
+            num_perm=config.get('num_perm', 64),
+            bands=config.get('bands', 16),
+            ngram=config.get('ngram', 4),
+            max_entries=config.get('max_entries', 100000),
+        )
+
+    def _index_for(self, namespace):
+        if namespace not in self.indexes:
+            self.indexes[namespace] = LSHIndex(self.num_perm, self.bands, self.max_entries)
+        return self.indexes[namespace]
+
+    def lookup(self, namespace, text):
+        """Return (cached_value, similarity) or (None, best_similarity)"""
+        start_time = time.perf_counter()
+        normalized = normalize_text(text)
+        facts = fact_tokens(text)
+        signature = self.hasher.signature(normalized)
+
+        def accept(entry):
+            return same_word_order(normalized, entry[0]) and same_facts(normalized, facts, entry[0], entry[1])
+
+        with self.lock:
+            index = self.indexes.get(namespace)
+            similarity, entry = index.query(signature, accept) if index else (0.0, None)
+
+            self.stats['lookups'] += 1
+            self.stats['total_lookup_time'] += time.perf_counter() - start_time
+            if entry is not None and similarity >= self.threshold:
+                self.stats['hits'] += 1
+                self.stats['total_hit_similarity'] += similarity
+                if similarity == 1.0:
+                    self.stats['exact_hits'] += 1
+                return entry[2], similarity
+            self.stats['misses'] += 1
+            return None, similarity
+
+    def store(self, namespace, text, value):
+        normalized = normalize_text(text)
+        signature = self.hasher.signature(normalized)
+        with self.lock:
+            self._index_for(namespace).add(signature, (normalized, fact_tokens(text), value))
+            self.stats['stores'] += 1
+
+    def get_stats(self):
+        """Hit/miss counts, hit rate, similarity and lookup latency"""
+        with self.lock:
+            stats = dict(self.stats)
+            stats['entries'] = sum(len(index) for index in self.indexes.values())
+            stats['namespaces'] = len(self.indexes)
+        lookups = stats['lookups']
+        stats['hit_rate'] = stats['hits'] / lookups * 100 if lookups else 0.0
+        stats['avg_hit_similarity'] = (stats['total_hit_similarity'] / stats['hits']
+                                       if stats['hits'] else 0.0)
+        stats['avg_lookup_ms'] = stats['total_lookup_time'] / lookups * 1000 if lookups else 0.0
+        return stats
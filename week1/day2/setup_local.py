@@ -35,7 +35,53 @@ def setup_local_project():
         "performance": {
             "enable_logging": True,
             "save_results": True,
-            "rate_limiting": 0.5
+            "rate_limiting": 0.5,
+            "throttle": {
+                "enabled": True,
+                "max_load_per_cpu": 1.5,
+                "max_cpu_pressure": 50.0,
+                "max_temp_c": 85.0,
+                "max_wait": 30.0
+            }
+        },
+        "token_budget": {
+            "context_size": 2048,
+            "policy": "truncate_tail",
+            "compact": True,
+            "max_input_tokens": 1536
+        },
+        "semantic_cache": {
+            "enabled": False,
+            "threshold": 0.9,
+            "num_perm": 64,
+            "bands": 16,
+            "max_entries": 100000
+        },
+        "tracing": {
+            "enabled": False,
+            "service": "genai"
+        },
+        "cascade": {
+            "enabled": False,
+            "small_model": "Llama-3.2-1B-Instruct-Q4_0.gguf",
+            "default_checks": {
+                "min_length": 20
+            }
+        },
+        "coalescing": {
+            "enabled": True
+        },
+        "models": {
+            "memory_budget_mb": None,
+            "pinned": [],
+            "sizes_mb": {},
+            "max_wait": 60.0
+        },
+        "long_input": {
+            "workers": 2,
+            "chunk_tokens": 1024,
+            "overlap_tokens": 64,
+            "max_levels": 4
         }
     }
     
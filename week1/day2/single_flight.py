@@ -0,0 +1,102 @@
+import asyncio
+import threading
+
+
+class _Call:
+    """One in-flight execution that duplicate callers attach to"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.tokens = []
+        self.subscribers = []
+        self.lock = threading.Lock()
+
+    def publish(self, token):
+        # Callbacks run outside the lock so a slow subscriber cannot stall
+        # late joiners; a subscriber that raises is dropped, not the generation
+        with self.lock:
+            self.tokens.append(token)
+            subscribers = list(self.subscribers)
+        for callback in subscribers:
+            if not _deliver(callback, token):
+                with self.lock:
+                    if callback in self.subscribers:
+                        self.subscribers.remove(callback)
+
+    def subscribe(self, callback):
+        # Replay under the lock so late joiners see tokens in order
+        with self.lock:
+            for token in self.tokens:
+                if not _deliver(callback, token):
+                    return
+            self.subscribers.append(callback)
+
+
+def _deliver(callback, token):
+    """Call one on_token subscriber; False if it raised"""
+    try:
+        callback(token)
+        return True
+    except Exception as e:
+        print(f"⚠️ Dropping token subscriber after error: {e}")
+        return False
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one execution
+
+    The first caller (the leader) runs fn(publish); callers arriving while
+    it runs wait for its result instead of repeating the work. Tokens the
+    leader passes to publish are fanned out to every caller's on_token,
+    with already-emitted tokens replayed to callers that join late.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.stats = {'executed': 0, 'coalesced': 0}
+
+    def do(self, key, fn, on_token=None):
+        """Return (result, is_leader); exceptions from fn reach every caller"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.stats['executed'] += 1
+            else:
+                self.stats['coalesced'] += 1
+
+        if on_token:
+            call.subscribe(on_token)
+
+        if leader:
+            try:
+                call.result = fn(call.publish)
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        else:
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        return call.result, leader
+
+    async def do_async(self, key, fn, on_token=None):
+        """Awaitable do(); the blocking work runs in the default executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.do, key, fn, on_token)
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        total = stats['executed'] + stats['coalesced']
+        stats['in_flight'] = len(self._calls)
+        stats['coalesce_rate'] = stats['coalesced'] / total * 100 if total else 0.0
+        return stats
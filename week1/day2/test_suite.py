@@ -1,6 +1,15 @@
 from prompt_manager_local import LocalPromptManager
+import os
+import sys
 import time
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from shared.throttle import AdaptiveThrottle
+
+def load_throttle(config_file="config.json"):
+    """Throttle driven by the performance section of config.json"""
+    return AdaptiveThrottle.from_config_file(config_file)
+
 def run_local_tests():
     """Run comprehensive tests with local model"""
     
@@ -60,6 +69,7 @@ choice for both beginners and experienced developers.
     
     all_results = {}
     total_time = 0
+    throttle = load_throttle()
     
     for i, test in enumerate(test_cases, 1):
         print(f"\n🎯 TEST {i}: {test['name']}")
@@ -93,7 +103,7 @@ choice for both beginners and experienced developers.
             print(f"❌ Error: {result.get('error')}")
         
         print("=" * 50)
-        time.sleep(1)  # Prevent overheating
+        throttle.wait()  # Pause only when load or temperature is too high
     
     # Performance summary
     print(f"\n📈 PERFORMANCE SUMMARY")
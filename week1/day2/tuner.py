@@ -0,0 +1,173 @@
+import argparse
+import json
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from shared.stats import percentile
+from eval_grid import EvalGrid
+
+
+def _round_up(value, step=10):
+    return int(math.ceil(value / step) * step)
+
+
+class TemplateTuner:
+    """Derives optimal_temperature and optimal_max_tokens from replayed samples
+
+    For each template the sample corpus is replayed at every candidate
+    temperature with a generous token budget so outputs end naturally.
+    The best temperature is the one with the highest quality pass rate
+    (ties go to the faster one); the proposed max_tokens is the smallest
+    budget that lets target_quantile of those answers finish, which is
+    then checked against the quality target and widened if needed.
+    """
+
+    def __init__(self, manager, quality_target=0.9, target_quantile=0.9, headroom=1.1,
+                 exploration_factor=2.0, max_budget=1024):
+        self.manager = manager
+        self.quality_target = quality_target
+        self.target_quantile = target_quantile
+        self.headroom = headroom
+        self.exploration_factor = exploration_factor
+        self.max_budget = max_budget
+        self.grid = EvalGrid(manager, cascade=False)
+
+    def tune_template(self, template_name, cases, temperatures, verify=True, repeats=1):
+        template = self.manager.templates[template_name]
+        exploration_budget = min(_round_up(template.optimal_max_tokens * self.exploration_factor),
+                                 self.max_budget)
+        print(f"\n🎛️ Tuning {template_name} (exploring up to {exploration_budget} tokens)")
+
+        table, summary = self.grid.run([template_name], cases, temperatures, [exploration_budget], repeats)
+        by_temperature = {cell['temperature']: cell for cell in summary}
+
+        lengths = {}
+        for row in table.rows():
+            if row['success'] and row['completion_tokens'] is not None:
+                lengths.setdefault(row['temperature'], []).append(row['completion_tokens'])
+
+        best_temperature = max(
+            by_temperature,
+            key=lambda t: (by_temperature[t]['pass_rate'], -(by_temperature[t]['avg_time'] or float('inf')))
+        )
+        best_lengths = lengths.get(best_temperature, [])
+        if not best_lengths:
+            print(f"⚠️ No successful outputs for {template_name}; keeping current settings")
+            return None
+
+        natural_length = percentile(best_lengths, self.target_quantile)
+        proposed_budget = min(_round_up(natural_length * self.headroom), exploration_budget)
+        exploration = {
+            'pass_rate': by_temperature[best_temperature]['pass_rate'],
+            'avg_time': by_temperature[best_temperature]['avg_time'],
+            'truncation_rate': sum(1 for n in best_lengths if n >= exploration_budget) / len(best_lengths) * 100,
+            'length_p50': percentile(best_lengths, 0.5),
+            'length_p90': percentile(best_lengths, 0.9),
+            'length_max': max(best_lengths),
+        }
+
+        verification = None
+        if verify:
+            verification = self._verify_budget(template_name, cases, best_temperature, proposed_budget,
+                                               exploration_budget, repeats)
+            proposed_budget = verification['max_tokens']
+
+        proposal = {
+            'template': template_name,
+            'current_temperature': template.optimal_temperature,
+            'current_max_tokens': template.optimal_max_tokens,
+            'proposed_temperature': best_temperature,
+            'proposed_max_tokens': proposed_budget,
+            'exploration': exploration,
+            'verification': verification,
+            'per_temperature': summary,
+        }
+        print(f"   temperature {template.optimal_temperature} → {best_temperature}, "
+              f"max_tokens {template.optimal_max_tokens} → {proposed_budget}")
+        return proposal
+
+    def _verify_budget(self, template_name, cases, temperature, budget, ceiling, repeats):
+        """Widen the budget until the quality target holds at it (or the ceiling is reached)"""
+        while True:
+            table, summary = self.grid.run([template_name], cases, [temperature], [budget], repeats)
+            cell = summary[0]
+            tokens = [row['completion_tokens'] for row in table.rows()
+                      if row['success'] and row['completion_tokens'] is not None]
+            truncation_rate = sum(1 for n in tokens if n >= budget) / len(tokens) * 100 if tokens else 100.0
+            if cell['pass_rate'] >= self.quality_target * 100 or budget >= ceiling:
+                return {
+                    'max_tokens': budget,
+                    'pass_rate': cell['pass_rate'],
+                    'avg_time': cell['avg_time'],
+                    'truncation_rate': truncation_rate,
+                    'met_target': cell['pass_rate'] >= self.quality_target * 100,
+                }
+            budget = min(_round_up(budget * 1.25), ceiling)
+
+    def tune(self, cases, template_names=None, temperatures=(0.2, 0.4, 0.7), verify=True, repeats=1):
+        """Tune each template on the cases addressed to it (or untargeted cases)"""
+        template_names = template_names or list(self.manager.templates)
+        proposals = {}
+        for name in template_names:
+            template_cases = [c for c in cases if c.get('template') in (None, name)]
+            if not template_cases:
+                continue
+            proposal = self.tune_template(name, template_cases, temperatures, verify, repeats)
+            if proposal:
+                proposals[name] = proposal
+        return proposals
+
+    def apply(self, proposals, write_back=False):
+        """Update templates in memory and optionally in the templates file"""
+        for name, proposal in proposals.items():
+            template = self.manager.templates[name]
+            template.optimal_temperature = proposal['proposed_temperature']
+            template.optimal_max_tokens = proposal['proposed_max_tokens']
+
+        if write_back:
+            with open(self.manager.templates_file, 'r') as f:
+                data = json.load(f)
+            for template_data in data['templates']:
+                proposal = proposals.get(template_data['name'])
+                if proposal:
+                    template_data['optimal_temperature'] = proposal['proposed_temperature']
+                    template_data['optimal_max_tokens'] = proposal['proposed_max_tokens']
+            with open(self.manager.templates_file, 'w') as f:
+                json.dump(data, f, indent=2)
+            print(f"✅ Wrote tuned parameters for {len(proposals)} templates to {self.manager.templates_file}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tune optimal_temperature and optimal_max_tokens per template')
+    parser.add_argument('--cases', required=True,
+                        help='JSONL sample corpus: {"name", "input", "template"?, "expected_keywords"?, ...}')
+    parser.add_argument('--templates', nargs='+', help='Templates to tune (default: all with cases)')
+    parser.add_argument('--temperatures', nargs='+', type=float, default=[0.2, 0.4, 0.7])
+    parser.add_argument('--quality-target', type=float, default=0.9,
+                        help='Required pass rate (0-1) at the proposed budget')
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--no-verify', action='store_true', help='Skip the verification run at the proposed budget')
+    parser.add_argument('--write', action='store_true', help='Write proposals back to the templates file')
+    parser.add_argument('--output', default='results/tuning_proposals.json')
+    args = parser.parse_args()
+
+    from prompt_manager import PromptManager
+
+    with open(args.cases, 'r') as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+
+    manager = PromptManager()
+    tuner = TemplateTuner(manager, quality_target=args.quality_target)
+    proposals = tuner.tune(cases, args.templates, args.temperatures, not args.no_verify, args.repeats)
+
+    with open(args.output, 'w') as f:
+        json.dump(proposals, f, indent=2)
+    print(f"💾 Proposals saved to {args.output}")
+
+    tuner.apply(proposals, write_back=args.write)
+
+
+if __name__ == "__main__":
+    main()
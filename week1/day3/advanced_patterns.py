@@ -55,7 +55,7 @@ class AdvancedPromptPatterns(PromptEngineeringLab):
                 result['simulated_temperature'] = temp
                 results.append(result)
             
-            time.sleep(1)
+            self.throttle.wait()
         
         return results
     
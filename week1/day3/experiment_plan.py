@@ -0,0 +1,276 @@
+import argparse
+import json
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+
+# Lab methods a plan node may call
+TECHNIQUES = {
+    'few_shot_prompting',
+    'chain_of_thought',
+    'role_prompting',
+    'delimiter_prompting',
+    'output_format_prompting',
+    'temperature_comparison',
+    'generate_response',
+}
+
+PLACEHOLDER = re.compile(r"\{(\w+)\.(\w+)\}")
+
+
+def load_plan(path):
+    """Read a plan from JSON, or YAML when PyYAML is installed"""
+    with open(path, 'r') as f:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("YAML plans need PyYAML: pip install pyyaml")
+            plan = yaml.safe_load(f)
+        else:
+            plan = json.load(f)
+    validate_plan(plan)
+    return plan
+
+
+def validate_plan(plan):
+    """Check technique names, dependency and placeholder references and acyclicity"""
+    nodes = {node['id']: node for node in plan['nodes']}
+    if len(nodes) != len(plan['nodes']):
+        raise ValueError("Duplicate node ids in plan")
+    for node in plan['nodes']:
+        if node['technique'] not in TECHNIQUES:
+            raise ValueError(f"Node '{node['id']}': unknown technique '{node['technique']}'")
+        for dep in node.get('depends_on', []):
+            if dep not in nodes:
+                raise ValueError(f"Node '{node['id']}' depends on unknown node '{dep}'")
+        # A placeholder is only resolvable once its node has finished
+        for ref in _placeholder_nodes(node.get('args', {})):
+            if ref not in node.get('depends_on', []):
+                raise ValueError(f"Node '{node['id']}' uses a placeholder from node '{ref}' "
+                                 f"that is not in its depends_on")
+    topological_order(plan)
+
+
+def topological_order(plan):
+    order = []
+    state = {}
+
+    def visit(node_id, nodes):
+        if state.get(node_id) == 'done':
+            return
+        if state.get(node_id) == 'visiting':
+            raise ValueError(f"Dependency cycle through node '{node_id}'")
+        state[node_id] = 'visiting'
+        for dep in nodes[node_id].get('depends_on', []):
+            visit(dep, nodes)
+        state[node_id] = 'done'
+        order.append(node_id)
+
+    nodes = {node['id']: node for node in plan['nodes']}
+    for node_id in nodes:
+        visit(node_id, nodes)
+    return order
+
+
+def descendant_counts(plan):
+    """How many nodes transitively depend on each node"""
+    children = {node['id']: [] for node in plan['nodes']}
+    for node in plan['nodes']:
+        for dep in node.get('depends_on', []):
+            children[dep].append(node['id'])
+
+    def descendants(node_id):
+        found = set()
+        for child in children[node_id]:
+            found.add(child)
+            found |= descendants(child)
+        return found
+
+    return {node_id: len(descendants(node_id)) for node_id in children}
+
+
+def _placeholder_nodes(value):
+    """Node ids referenced by {node_id.field} placeholders in value"""
+    if isinstance(value, str):
+        return {m.group(1) for m in PLACEHOLDER.finditer(value)}
+    if isinstance(value, list):
+        return set().union(*(_placeholder_nodes(v) for v in value))
+    if isinstance(value, dict):
+        return set().union(*(_placeholder_nodes(v) for v in value.values()))
+    return set()
+
+
+def _resolve(value, results):
+    """Substitute {node_id.field} placeholders with dependency results"""
+    if isinstance(value, str):
+        return PLACEHOLDER.sub(lambda m: str(results[m.group(1)].get(m.group(2), '')), value)
+    if isinstance(value, list):
+        return [_resolve(v, results) for v in value]
+    if isinstance(value, dict):
+        return {k: _resolve(v, results) for k, v in value.items()}
+    return value
+
+
+class PlanRunner:
+    """Runs an experiment plan DAG, executing independent nodes concurrently
+
+    Each worker is a lab instance with its own loaded model; a node borrows
+    a free worker for its duration, so concurrency is bounded by the number
+    of workers. Ready nodes with more dependents start first, and nodes
+    whose dependencies failed are skipped.
+    """
+
+    def __init__(self, labs):
+        self.labs = list(labs)
+        self.pool = queue.Queue()
+        for lab in self.labs:
+            self.pool.put(lab)
+
+    def _run_node(self, node, results, origin):
+        lab = self.pool.get()
+        try:
+            start = time.time()
+            args = _resolve(node.get('args', {}), results)
+            method = getattr(lab, node['technique'])
+            output = method(**args)
+            end = time.time()
+        finally:
+            self.pool.put(lab)
+        return {
+            'output': output,
+            'start': start - origin,
+            'end': end - origin,
+            'duration': end - start,
+            'worker': self.labs.index(lab),
+            'thread': threading.current_thread().name,
+        }
+
+    def run(self, plan):
+        validate_plan(plan)
+        nodes = {node['id']: node for node in plan['nodes']}
+        # Start nodes that unblock the most work first
+        priority = descendant_counts(plan)
+        pending = {node_id: nodes[node_id] for node_id in sorted(nodes, key=lambda n: -priority[n])}
+        results = {}
+        timings = {}
+        failed = set()
+        origin = time.time()
+        print(f"\n🗺️ Running plan '{plan.get('name', 'unnamed')}': {len(nodes)} nodes on {len(self.labs)} worker(s)")
+
+        with ThreadPoolExecutor(max_workers=len(self.labs)) as executor:
+            running = {}
+            while pending or running:
+                for node_id, node in list(pending.items()):
+                    deps = node.get('depends_on', [])
+                    if any(dep in failed for dep in deps):
+                        print(f"⏭️ {node_id}: skipped (dependency failed)")
+                        failed.add(node_id)
+                        del pending[node_id]
+                    elif all(dep in results for dep in deps):
+                        running[executor.submit(self._run_node, node, dict(results), origin)] = node_id
+                        del pending[node_id]
+
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node_id = running.pop(future)
+                    try:
+                        outcome = future.result()
+                    except Exception as e:
+                        print(f"❌ {node_id}: {e}")
+                        failed.add(node_id)
+                        continue
+                    timings[node_id] = outcome
+                    output = outcome['output']
+                    if output is None:
+                        failed.add(node_id)
+                        continue
+                    # List outputs (temperature_comparison) expose their last item's fields
+                    results[node_id] = output[-1] if isinstance(output, list) and output else output
+                    print(f"✅ {node_id}: {outcome['duration']:.2f}s on worker {outcome['worker']}")
+
+        wall_time = time.time() - origin
+        report = self._report(plan, nodes, timings, failed, wall_time)
+        report['results'] = {node_id: timings[node_id]['output'] for node_id in timings}
+        return report
+
+    def _report(self, plan, nodes, timings, failed, wall_time):
+        # Critical path: longest chain of measured durations through the DAG
+        finish = {}
+        previous = {}
+        for node_id in topological_order(plan):
+            if node_id not in timings:
+                continue
+            best_dep = max((dep for dep in nodes[node_id].get('depends_on', []) if dep in finish),
+                           key=lambda dep: finish[dep], default=None)
+            finish[node_id] = timings[node_id]['duration'] + (finish[best_dep] if best_dep else 0.0)
+            previous[node_id] = best_dep
+
+        critical_path = []
+        if finish:
+            node_id = max(finish, key=finish.get)
+            while node_id:
+                critical_path.append(node_id)
+                node_id = previous[node_id]
+            critical_path.reverse()
+
+        serial_time = sum(t['duration'] for t in timings.values())
+        return {
+            'plan': plan.get('name', 'unnamed'),
+            'workers': len(self.labs),
+            'wall_time': wall_time,
+            'serial_time': serial_time,
+            'speedup': serial_time / wall_time if wall_time else 0.0,
+            'critical_path': critical_path,
+            'critical_path_time': finish[critical_path[-1]] if critical_path else 0.0,
+            'failed': sorted(failed),
+            'nodes': {node_id: {k: v for k, v in t.items() if k != 'output'} for node_id, t in timings.items()},
+        }
+
+
+def print_report(report):
+    print(f"\n📊 PLAN REPORT: {report['plan']}")
+    print(f"Wall time: {report['wall_time']:.2f}s on {report['workers']} worker(s)")
+    print(f"Serial time: {report['serial_time']:.2f}s (speedup {report['speedup']:.2f}x)")
+    print(f"Critical path ({report['critical_path_time']:.2f}s): {' → '.join(report['critical_path'])}")
+    if report['failed']:
+        print(f"Failed/skipped: {', '.join(report['failed'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a prompt-engineering experiment plan')
+    parser.add_argument('plan', help='Plan file (.json, or .yaml with PyYAML installed)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Model workers (each holds its own replica under the shared memory budget)')
+    args = parser.parse_args()
+
+    from advanced_patterns import AdvancedPromptPatterns
+
+    plan = load_plan(args.plan)
+    # One registry for every worker, so replicas share the models memory budget
+    labs = [AdvancedPromptPatterns()]
+    for i in range(1, args.workers):
+        labs.append(AdvancedPromptPatterns(models=labs[0].models, model_name=f"{labs[0].model_name}#{i}"))
+    report = PlanRunner(labs).run(plan)
+    print_report(report)
+
+    # Gather every worker's experiments into one lab for analysis and saving
+    primary = labs[0]
+    for lab in labs[1:]:
+        primary.experiments.extend(lab.experiments)
+    primary.analyze_techniques()
+    primary.save_experiments()
+
+    report_file = f"plan_report_{datetime.now().strftime('%Y%m%d_%H%M')}.json"
+    with open(report_file, 'w') as f:
+        json.dump({k: v for k, v in report.items() if k != 'results'}, f, indent=2)
+    print(f"💾 Plan report saved to {report_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,64 @@
 from gpt4all import GPT4All
 import json
+import os
+import queue
+import re
+import sys
 import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import ExitStack
 from datetime import datetime
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from shared.token_budget import TokenBudget
+from shared.tracing import Tracer, timed_stream
+from shared.deadline import Deadline, RateEstimator
+from shared.throttle import AdaptiveThrottle
+from shared.model_registry import ModelRegistry
+
+# The week's shared runtime settings (throttle thresholds, polling interval, model memory budget)
+DEFAULT_CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'day2', 'config.json')
+DEFAULT_MODEL = "Meta-Llama-3-8B-Instruct.Q4_0.gguf"
+
+FINAL_ANSWER_PATTERN = re.compile(r"final answer\s*[:\-]\s*(.+)", re.IGNORECASE)
+# Stop a reasoning sample once its final-answer line is complete
+FINAL_ANSWER_STOP = re.compile(r"final answer\s*[:\-]\s*[^\n]+\n", re.IGNORECASE)
+
+def extract_final_answer(response):
+    """Final answer of a reasoning path: the 'Final answer:' line, else the last line"""
+    matches = FINAL_ANSWER_PATTERN.findall(response)
+    if matches:
+        return matches[-1].strip()
+    lines = [line.strip() for line in response.strip().splitlines() if line.strip()]
+    return lines[-1] if lines else ""
+
+def normalize_answer(answer):
+    """Canonical form used for voting"""
+    answer = re.sub(r"[^\w\s.]", " ", answer.lower())
+    return re.sub(r"\s+", " ", answer).strip(" .")
+
 class PromptEngineeringLab:
     """Apply your prompt engineering knowledge with local models"""
     
-    def __init__(self):
+    def __init__(self, context_size=2048, truncation_policy="truncate_middle", tracer=None, deadline=None,
+                 config_file=DEFAULT_CONFIG_FILE, models=None, model_name=DEFAULT_MODEL):
+        """models is a ModelRegistry to share with other labs (e.g. 'model.gguf#2'
+        replicas for parallel workers); by default the lab builds its own and pins model_name"""
         print("🧪 Prompt Engineering Lab - Applying DeepLearning.AI Concepts")
-        self.model = GPT4All("Meta-Llama-3-8B-Instruct.Q4_0.gguf")
+        self.tracer = tracer or Tracer(enabled=False)
+        self.deadline = deadline
+        self.rate_estimator = RateEstimator()
+        self.throttle = AdaptiveThrottle.from_config_file(config_file)
+        self.token_budget = TokenBudget(context_size=context_size, policy=truncation_policy)
+        self.model_name = model_name
+        if models is None:
+            models = ModelRegistry.from_config_file(
+                config_file, loader=lambda name: GPT4All(name, n_ctx=context_size))
+            models.pin(model_name)
+        self.models = models
+        # Load up front so a missing model fails here, not on the first prompt
+        self.models.get(model_name)
         self.experiments = []
         
     def few_shot_prompting(self, task, examples, new_input):
@@ -26,8 +76,12 @@ class PromptEngineeringLab:
         
         return self.generate_response(prompt, "few_shot")
     
-    def chain_of_thought(self, problem):
-        """Apply chain-of-thought prompting"""
+    def chain_of_thought(self, problem, samples=1, early_stop=True, workers=None):
+        """Apply chain-of-thought prompting
+        
+        With samples > 1, runs self-consistency: several reasoning paths are
+        sampled and the majority final answer is returned.
+        """
         
         prompt = f"""
         Let's think step by step to solve this problem:
@@ -42,7 +96,98 @@ class PromptEngineeringLab:
         Let me work through this:
         """
         
-        return self.generate_response(prompt, "chain_of_thought")
+        if samples <= 1:
+            return self.generate_response(prompt, "chain_of_thought")
+        
+        prompt += """
+        End with a single line of the form "Final answer: <answer>".
+        """
+        return self.self_consistency(prompt, samples, early_stop, workers)
+    
+    def _replicas(self, count):
+        """Up to count model names ('model.gguf', 'model.gguf#1', ...) that fit the memory budget"""
+        replica_mb = self.models.estimate_size(self.model_name)
+        if replica_mb:
+            free = self.models.budget_mb - self.models.resident_mb()
+            count = min(count, 1 + int(free // replica_mb))
+        return [self.model_name] + [f"{self.model_name}#{i}" for i in range(1, max(count, 1))]
+    
+    def self_consistency(self, prompt, samples, early_stop=True, workers=None):
+        """Sample reasoning paths and vote on their final answers
+        
+        Paths run concurrently on up to `workers` model replicas (default:
+        one per sample, capped by the memory budget). Each path stops as
+        soon as its final-answer line is written, and no new paths start
+        once the remaining ones could not overturn the leading answer.
+        GPT4All cannot fork a prefilled KV state, so every path still pays
+        its own prefill; the result reports this as prefill_shared=False.
+        """
+        start_time = time.time()
+        votes = Counter()
+        paths = []
+        replicas = self._replicas(min(workers or samples, samples))
+        pool = queue.Queue()
+        for replica in replicas:
+            pool.put(replica)
+        
+        def sample():
+            replica = pool.get()
+            try:
+                return self.generate_response(prompt, "chain_of_thought_sc", stop_pattern=FINAL_ANSWER_STOP,
+                                              model_name=replica)
+            finally:
+                pool.put(replica)
+        
+        completed = 0
+        stopped = False
+        with ThreadPoolExecutor(max_workers=len(replicas)) as executor:
+            pending = {executor.submit(sample) for _ in range(len(replicas))}
+            submitted = len(pending)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    completed += 1
+                    result = future.result()
+                    if result is None:
+                        continue
+                    answer = extract_final_answer(result['response'])
+                    key = normalize_answer(answer)
+                    votes[key] += 1
+                    paths.append({'answer': answer, 'key': key, 'response': result['response']})
+                
+                # Paths still running count as remaining votes
+                remaining = samples - completed
+                ranked = votes.most_common(2)
+                runner_up = ranked[1][1] if len(ranked) > 1 else 0
+                if early_stop and ranked and ranked[0][1] > runner_up + remaining:
+                    stopped = True
+                while not stopped and submitted < samples and len(pending) < len(replicas):
+                    pending.add(executor.submit(sample))
+                    submitted += 1
+        
+        if not paths:
+            return None
+        
+        majority_key, majority_votes = votes.most_common(1)[0]
+        representative = next(p for p in paths if p['key'] == majority_key)
+        outcome = {
+            'technique': 'chain_of_thought_self_consistency',
+            'prompt': prompt,
+            'answer': representative['answer'],
+            'response': representative['response'],
+            'votes': dict(votes),
+            'agreement': majority_votes / len(paths),
+            'samples_requested': samples,
+            'samples_used': len(paths),
+            'early_stopped': submitted < samples,
+            'sample_answers': [p['answer'] for p in paths],
+            'workers': len(replicas),
+            'prefill_shared': False,
+            'execution_time': time.time() - start_time
+        }
+        print(f"🗳️ Self-consistency: '{outcome['answer']}' with {majority_votes}/{len(paths)} votes "
+              f"on {len(replicas)} worker(s){' (stopped early)' if outcome['early_stopped'] else ''}")
+        return outcome
     
     def role_prompting(self, role, task):
         """Apply role-based prompting technique"""
@@ -73,32 +218,92 @@ class PromptEngineeringLab:
         
         return results
     
-    def generate_response(self, prompt, technique):
-        """Generate response and track the experiment"""
+    def generate_response(self, prompt, technique, deadline=None, stop_pattern=None, model_name=None):
+        """Generate response and track the experiment
+        
+        deadline (seconds, defaults to the lab-wide setting) caps latency: the
+        token budget is sized from measured speeds and generation stops when
+        time runs out, flagging the experiment 'truncated'. Generation also
+        stops once the response matches stop_pattern (a compiled regex).
+        model_name picks a replica from the lab's registry (default: the lab's model).
+        """
+        deadline = deadline if deadline is not None else self.deadline
+        with self.tracer.span('generate_response', technique=technique):
+            return self._generate_response(prompt, technique, Deadline(deadline) if deadline else None,
+                                           stop_pattern, model_name or self.model_name)
+    
+    def _stop_callback(self, deadline, stop_pattern):
+        """GPT4All callback combining the deadline and the stop pattern"""
+        if not deadline and not stop_pattern:
+            return None
+        pieces = []
+        
+        def callback(token_id, piece):
+            if deadline and not deadline.callback(token_id, piece):
+                return False
+            if stop_pattern:
+                pieces.append(piece)
+                if stop_pattern.search(''.join(pieces)):
+                    return False
+            return True
+        
+        return callback
+    
+    def _generate_response(self, prompt, technique, deadline, stop_pattern, model_name):
+        requested_max_tokens = 200
         
         try:
+            with self.tracer.span('tokenization'):
+                prompt, budget_report = self.token_budget.fit_prompt(prompt, requested_max_tokens)
+            if budget_report['truncated']:
+                print(f"✂️ {technique}: prompt truncated to {budget_report['input_tokens']} tokens")
+            
+            max_tokens = requested_max_tokens
+            if deadline:
+                max_tokens = self.rate_estimator.plan_max_tokens(
+                    technique, budget_report['prompt_tokens'], deadline.time_left(), requested_max_tokens)
+            
             start_time = time.time()
             
-            with self.model.chat_session():
-                response = self.model.generate(
-                    prompt,
-                    max_tokens=200,
-                    temp=0.7
-                )
+            stop_callback = self._stop_callback(deadline, stop_pattern)
+            generate_kwargs = {'callback': stop_callback} if stop_callback else {}
+            # Held for the whole generation so the registry cannot evict the model mid-stream
+            with self.models.acquire(model_name) as model, ExitStack() as stack:
+                with self.tracer.span('session_setup'):
+                    stack.enter_context(model.chat_session())
+                response, generated_tokens, prefill_time, decode_time = timed_stream(
+                    self.tracer, model.generate(
+                        prompt,
+                        max_tokens=max_tokens,
+                        temp=0.7,
+                        streaming=True,
+                        **generate_kwargs
+                    ))
             
             execution_time = time.time() - start_time
+            self.rate_estimator.update(technique, budget_report['prompt_tokens'], prefill_time,
+                                       generated_tokens, decode_time)
+            truncated = bool(deadline) and (deadline.hit or (max_tokens < requested_max_tokens
+                                                             and generated_tokens >= max_tokens))
             
+            post_start = time.perf_counter()
             experiment = {
                 'technique': technique,
                 'prompt': prompt,
+                'prompt_truncated': budget_report['truncated'],
+                'truncated': truncated,
+                'deadline': deadline.seconds if deadline else None,
+                'max_tokens': max_tokens,
                 'response': response.strip(),
                 'execution_time': execution_time,
                 'timestamp': datetime.now().isoformat(),
                 'prompt_length': len(prompt),
                 'response_length': len(response)
             }
+            self.tracer.record('post_processing', post_start, time.perf_counter())
             
-            self.experiments.append(experiment)
+            with self.tracer.span('persistence'):
+                self.experiments.append(experiment)
             
             print(f"✅ {technique}: {execution_time:.2f}s")
             return experiment
@@ -205,8 +410,9 @@ class PromptEngineeringLab:
         """Save all experiments"""
         filename = f"prompt_experiments_{datetime.now().strftime('%Y%m%d_%H%M')}.json"
         
-        with open(filename, 'w') as f:
-            json.dump(self.experiments, f, indent=2)
+        with self.tracer.span('persistence', file=filename):
+            with open(filename, 'w') as f:
+                json.dump(self.experiments, f, indent=2)
         
         print(f"\n💾 Saved {len(self.experiments)} experiments to {filename}")
         return filename
@@ -0,0 +1 @@
+"""Helpers shared by the week 1 tools (day1 completer, day2 manager, day3 lab)"""
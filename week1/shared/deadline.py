@@ -0,0 +1,71 @@
+import time
+
+GLOBAL_KEY = '__all__'
+
+
+class RateEstimator:
+    """Tracks measured prefill and decode speeds (tokens/second) per key
+
+    Keys are template names or technique names. Rates are exponentially
+    weighted so they follow thermal throttling and load changes; keys with
+    no history fall back to the rate measured across all keys.
+    """
+
+    def __init__(self, smoothing=0.3):
+        self.smoothing = smoothing
+        self.rates = {}
+
+    def update(self, key, prompt_tokens, prefill_time, generated_tokens, decode_time):
+        for k in (key, GLOBAL_KEY):
+            entry = self.rates.setdefault(k, {'prefill_tps': None, 'decode_tps': None, 'samples': 0})
+            if prompt_tokens and prefill_time > 0:
+                entry['prefill_tps'] = self._blend(entry['prefill_tps'], prompt_tokens / prefill_time)
+            if generated_tokens > 1 and decode_time > 0:
+                # the first token is produced by prefill
+                entry['decode_tps'] = self._blend(entry['decode_tps'], (generated_tokens - 1) / decode_time)
+            entry['samples'] += 1
+
+    def _blend(self, old, new):
+        if old is None:
+            return new
+        return (1 - self.smoothing) * old + self.smoothing * new
+
+    def get(self, key):
+        entry = self.rates.get(key) or {}
+        fallback = self.rates.get(GLOBAL_KEY) or {}
+        return (entry.get('prefill_tps') or fallback.get('prefill_tps'),
+                entry.get('decode_tps') or fallback.get('decode_tps'))
+
+    def plan_max_tokens(self, key, prompt_tokens, time_left, requested_max_tokens,
+                        min_tokens=16, safety=0.9):
+        """Largest max_tokens expected to finish within time_left seconds
+
+        Returns requested_max_tokens unchanged until rates have been measured.
+        """
+        prefill_tps, decode_tps = self.get(key)
+        if not prefill_tps or not decode_tps:
+            return requested_max_tokens
+        decode_time = time_left * safety - prompt_tokens / prefill_tps
+        affordable = int(decode_time * decode_tps) + 1
+        return max(min(requested_max_tokens, affordable), min_tokens)
+
+
+class Deadline:
+    """Wall-clock deadline for one request, started at construction"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.perf_counter() + seconds
+        self.hit = False
+
+    def time_left(self):
+        return self.expires_at - time.perf_counter()
+
+    def expired(self):
+        if time.perf_counter() >= self.expires_at:
+            self.hit = True
+        return self.hit
+
+    def callback(self, token_id, response):
+        """GPT4All response callback: returning False stops generation"""
+        return not self.expired()
@@ -0,0 +1,269 @@
+import gc
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Where GPT4All keeps downloaded .gguf files; used to size models before loading
+DEFAULT_SEARCH_PATHS = ('.', '~/.cache/gpt4all', '~/.local/share/nomic.ai/GPT4All')
+
+
+class ModelBudgetError(MemoryError):
+    """A model cannot be made resident without exceeding the memory budget"""
+
+
+def read_rss_mb():
+    """Resident set size of this process in MB, or None if unavailable"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024.0
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def read_total_memory_mb():
+    """Physical memory in MB, or None if unavailable"""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemTotal:'):
+                    return int(line.split()[1]) / 1024.0
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def base_name(name):
+    """Model name without its '#replica' suffix"""
+    return name.split('#', 1)[0]
+
+
+class _Entry:
+    def __init__(self, model, size_mb, load_time):
+        self.model = model
+        self.size_mb = size_mb
+        self.load_time = load_time
+        self.in_use = 0
+        self.uses = 0
+        self.loading = False
+
+
+class ModelRegistry:
+    """Loads models on demand and keeps the resident set under a memory budget
+
+    loader(name) builds a model. Each model's footprint is taken from
+    sizes_mb, else from its weights file on disk (for .gguf files), and is
+    corrected after loading by the measured RSS growth when that is larger.
+    Before a load that would exceed budget_mb, the least recently used
+    models are unloaded; pinned models and models inside acquire() are
+    never evicted. If nothing evictable frees enough room the load waits
+    up to max_wait seconds for a model to be released, then raises
+    ModelBudgetError.
+
+    The loader runs without holding the registry lock: a placeholder entry
+    reserves the estimated size while it loads, and other callers asking
+    for the same model wait for that load instead of starting another.
+
+    A name like 'model.gguf#2' is an extra replica of 'model.gguf': the
+    loader gets the plain name, but the replica is sized, budgeted and
+    evicted as a model of its own, so parallel workers can each hold one.
+    """
+
+    def __init__(self, loader, budget_mb=None, pinned=(), sizes_mb=None, default_size_mb=0.0,
+                 search_paths=DEFAULT_SEARCH_PATHS, max_wait=60.0):
+        self.loader = loader
+        if budget_mb is None:
+            total = read_total_memory_mb()
+            budget_mb = total * 0.75 if total else float('inf')
+        self.budget_mb = budget_mb
+        self.pinned = set(pinned)
+        self.sizes_mb = dict(sizes_mb or {})
+        self.default_size_mb = default_size_mb
+        self.search_paths = search_paths
+        self.max_wait = max_wait
+        self._models = OrderedDict()  # least recently used first
+        self._condition = threading.Condition()
+        self.stats = {'hits': 0, 'loads': 0, 'evictions': 0, 'load_time': 0.0, 'waits': 0}
+
+    @classmethod
+    def from_config(cls, config, loader):
+        """Build from the 'models' section of config.json"""
+        config = config or {}
+        return cls(
+            loader,
+            budget_mb=config.get('memory_budget_mb'),
+            pinned=config.get('pinned', []),
+            sizes_mb=config.get('sizes_mb'),
+            default_size_mb=config.get('default_size_mb', 0.0),
+            max_wait=config.get('max_wait', 60.0),
+        )
+
+    @classmethod
+    def from_config_file(cls, config_file, loader):
+        """Build from a config.json path; defaults if the file is missing"""
+        try:
+            with open(config_file, 'r') as f:
+                return cls.from_config(json.load(f).get('models'), loader)
+        except FileNotFoundError:
+            return cls(loader)
+
+    def estimate_size(self, name):
+        """Expected resident MB for a model that is not loaded yet"""
+        name = base_name(name)
+        if name in self.sizes_mb:
+            return self.sizes_mb[name]
+        for directory in self.search_paths:
+            path = os.path.join(os.path.expanduser(directory), name)
+            if os.path.isfile(path):
+                return os.path.getsize(path) / (1024 * 1024)
+        return self.default_size_mb
+
+    def resident_mb(self):
+        return sum(entry.size_mb for entry in self._models.values())
+
+    def pin(self, name):
+        self.pinned.add(name)
+
+    def unpin(self, name):
+        self.pinned.discard(name)
+
+    def is_loaded(self, name):
+        entry = self._models.get(name)
+        return entry is not None and not entry.loading
+
+    @contextmanager
+    def acquire(self, name):
+        """Yield the model, loading it if needed; it cannot be evicted until released"""
+        with self._condition:
+            entry = self._ensure_loaded(name)
+            entry.in_use += 1
+        try:
+            yield entry.model
+        finally:
+            with self._condition:
+                entry.in_use -= 1
+                self._condition.notify_all()
+
+    def get(self, name):
+        """Return the model, loading it if needed (it stays evictable)"""
+        with self._condition:
+            return self._ensure_loaded(name).model
+
+    def _ensure_loaded(self, name):
+        """Return the entry for name; called with _condition held, which is released during the load"""
+        needed = None
+        deadline = time.time() + self.max_wait
+        while True:
+            entry = self._models.get(name)
+            if entry is not None:
+                if entry.loading:
+                    # Another thread is loading it; wait until it lands or the load fails
+                    self._condition.wait()
+                    continue
+                self._models.move_to_end(name)
+                entry.uses += 1
+                self.stats['hits'] += 1
+                return entry
+
+            if needed is None:
+                needed = self.estimate_size(name)
+                if needed > self.budget_mb:
+                    raise ModelBudgetError(
+                        f"Model {name} needs ~{needed:.0f}MB, over the {self.budget_mb:.0f}MB budget")
+            if self._make_room(needed):
+                break
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise ModelBudgetError(
+                    f"Cannot fit {name} (~{needed:.0f}MB): {self.resident_mb():.0f}MB of "
+                    f"{self.budget_mb:.0f}MB held by pinned or busy models")
+            self.stats['waits'] += 1
+            self._condition.wait(remaining)
+
+        # Busy placeholder: holds the estimated size in the budget and cannot be evicted
+        entry = _Entry(None, needed, 0.0)
+        entry.loading = True
+        entry.in_use = 1
+        self._models[name] = entry
+        print(f"📦 Loading model {name} (~{needed:.0f}MB, {self.resident_mb():.0f}/{self.budget_mb:.0f}MB resident)")
+
+        loaded = False
+        self._condition.release()
+        try:
+            rss_before = read_rss_mb()
+            start = time.time()
+            model = self.loader(base_name(name))
+            load_time = time.time() - start
+            rss_after = read_rss_mb()
+            loaded = True
+        finally:
+            self._condition.acquire()
+            if not loaded:
+                del self._models[name]
+                self._condition.notify_all()
+
+        # Concurrent loads can inflate the RSS delta; it only ever raises the estimate
+        if rss_before is not None and rss_after is not None:
+            entry.size_mb = max(needed, rss_after - rss_before)
+        entry.model = model
+        entry.load_time = load_time
+        entry.loading = False
+        entry.in_use = 0
+        entry.uses = 1
+        self._models.move_to_end(name)
+        self.stats['loads'] += 1
+        self.stats['load_time'] += load_time
+        self._condition.notify_all()
+        # The measured size may exceed the estimate; settle up with idle models
+        self._make_room(0.0, keep=name)
+        return entry
+
+    def _make_room(self, needed, keep=None):
+        """Evict idle, unpinned models (LRU first) until needed MB fits; False if it cannot"""
+        while self.resident_mb() + needed > self.budget_mb:
+            victim = next((name for name, entry in self._models.items()
+                           if name not in self.pinned and name != keep and entry.in_use == 0), None)
+            if victim is None:
+                return False
+            self.evict(victim)
+        return True
+
+    def evict(self, name):
+        """Unload a model now, unless it is in use"""
+        with self._condition:
+            entry = self._models.get(name)
+            if entry is None or entry.in_use:
+                return False
+            del self._models[name]
+            close = getattr(entry.model, 'close', None)
+            if callable(close):
+                close()
+            entry.model = None
+            gc.collect()
+            self.stats['evictions'] += 1
+            print(f"♻️ Evicted model {name} ({entry.size_mb:.0f}MB)")
+            return True
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats.update({
+            'budget_mb': self.budget_mb,
+            'resident_mb': self.resident_mb(),
+            'models': {
+                name: {
+                    'size_mb': entry.size_mb,
+                    'load_time': entry.load_time,
+                    'uses': entry.uses,
+                    'in_use': entry.in_use,
+                    'pinned': name in self.pinned,
+                    'loading': entry.loading,
+                }
+                for name, entry in self._models.items()
+            },
+        })
+        return stats
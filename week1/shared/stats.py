@@ -0,0 +1,6 @@
+def percentile(values, fraction):
+    """Nearest-rank percentile (fraction in 0..1) of values, or None if empty"""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
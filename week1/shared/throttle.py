@@ -0,0 +1,132 @@
+import glob
+import json
+import os
+import time
+
+
+def read_load_per_cpu():
+    """1-minute load average divided by CPU count, or None if unavailable"""
+    try:
+        with open('/proc/loadavg') as f:
+            load_1min = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        if not hasattr(os, 'getloadavg'):
+            return None
+        try:
+            load_1min = os.getloadavg()[0]
+        except OSError:
+            return None
+    return load_1min / (os.cpu_count() or 1)
+
+
+def read_cpu_pressure():
+    """PSI 'some avg10' for the CPU (percent of time tasks waited), or None"""
+    try:
+        with open('/proc/pressure/cpu') as f:
+            for line in f:
+                if line.startswith('some'):
+                    for field in line.split()[1:]:
+                        key, value = field.split('=')
+                        if key == 'avg10':
+                            return float(value)
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def read_max_temperature():
+    """Hottest thermal zone in degrees Celsius, or None if no zones are exposed"""
+    temperatures = []
+    for path in glob.glob('/sys/class/thermal/thermal_zone*/temp'):
+        try:
+            with open(path) as f:
+                temperatures.append(int(f.read().strip()) / 1000.0)
+        except (OSError, ValueError):
+            continue
+    return max(temperatures) if temperatures else None
+
+
+class AdaptiveThrottle:
+    """Pause between requests only while the machine is overloaded or hot
+
+    Replaces fixed sleeps: wait() returns immediately when load, CPU
+    pressure and temperature are under their thresholds, and otherwise
+    polls every poll_interval seconds until they recover or max_wait
+    elapses. Signals that cannot be read (e.g. on Windows or inside some
+    containers) are ignored, so the throttle never blocks on missing data.
+
+    CPU pressure (PSI avg10) and temperature are the main signals. The
+    1-minute load average mostly counts our own inference threads and lags
+    by about a minute, so its default threshold sits above one runnable
+    task per CPU and only catches real oversubscription.
+    """
+
+    def __init__(self, max_load_per_cpu=1.5, max_cpu_pressure=50.0, max_temp_c=85.0,
+                 poll_interval=0.5, max_wait=30.0, enabled=True):
+        self.max_load_per_cpu = max_load_per_cpu
+        self.max_cpu_pressure = max_cpu_pressure
+        self.max_temp_c = max_temp_c
+        self.poll_interval = poll_interval
+        self.max_wait = max_wait
+        self.enabled = enabled
+        self.stats = {'checks': 0, 'pauses': 0, 'total_wait': 0.0, 'last_reason': None}
+
+    @classmethod
+    def from_config(cls, performance_config):
+        """Build from the 'performance' section of config.json
+
+        'rate_limiting' is the polling interval used while throttled; the
+        thresholds live under 'throttle'.
+        """
+        performance_config = performance_config or {}
+        config = performance_config.get('throttle', {})
+        return cls(
+            max_load_per_cpu=config.get('max_load_per_cpu', 1.5),
+            max_cpu_pressure=config.get('max_cpu_pressure', 50.0),
+            max_temp_c=config.get('max_temp_c', 85.0),
+            poll_interval=performance_config.get('rate_limiting', 0.5),
+            max_wait=config.get('max_wait', 30.0),
+            enabled=config.get('enabled', True),
+        )
+
+    @classmethod
+    def from_config_file(cls, config_file):
+        """Build from a config.json path; defaults if the file is missing"""
+        try:
+            with open(config_file, 'r') as f:
+                return cls.from_config(json.load(f).get('performance'))
+        except FileNotFoundError:
+            return cls()
+
+    def overload_reason(self):
+        """Describe the first exceeded threshold, or None if all are fine"""
+        load = read_load_per_cpu()
+        if self.max_load_per_cpu is not None and load is not None and load > self.max_load_per_cpu:
+            return f"load {load:.2f}/cpu > {self.max_load_per_cpu}"
+        pressure = read_cpu_pressure()
+        if self.max_cpu_pressure is not None and pressure is not None and pressure > self.max_cpu_pressure:
+            return f"cpu pressure {pressure:.1f}% > {self.max_cpu_pressure}%"
+        temperature = read_max_temperature()
+        if self.max_temp_c is not None and temperature is not None and temperature > self.max_temp_c:
+            return f"temperature {temperature:.1f}°C > {self.max_temp_c}°C"
+        return None
+
+    def wait(self):
+        """Block while thresholds are exceeded; returns seconds spent waiting"""
+        if not self.enabled:
+            return 0.0
+        self.stats['checks'] += 1
+        reason = self.overload_reason()
+        if reason is None:
+            return 0.0
+
+        print(f"🌡️ Throttling: {reason}")
+        self.stats['pauses'] += 1
+        self.stats['last_reason'] = reason
+        start = time.time()
+        while reason is not None and time.time() - start < self.max_wait:
+            time.sleep(self.poll_interval)
+            reason = self.overload_reason()
+        waited = time.time() - start
+        self.stats['total_wait'] += waited
+        return waited
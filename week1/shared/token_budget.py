@@ -0,0 +1,232 @@
+import re
+
+# Slicing units for the approximate tokenizer: words, with long runs broken up
+# so a single huge "word" can still be truncated or chunked
+_PIECE = re.compile(r'\s*\S{1,12}')
+
+POLICIES = ('truncate_tail', 'truncate_head', 'truncate_middle', 'reject')
+
+DEFAULT_BOILERPLATE_PATTERNS = [
+    r'^sent from my \w+',
+    r'^confidentiality notice',
+    r'^this (e-?mail|message) (and any attachments )?(is|are) (confidential|intended)',
+    r'^to unsubscribe',
+    r'^-{2,}\s*original message\s*-{2,}$',
+]
+
+
+class ContextOverflowError(ValueError):
+    """Raised when a prompt does not fit the context and the policy is 'reject'"""
+
+
+class ApproximateTokenizer:
+    """Token estimate used when the backend exposes no tokenizer
+
+    The larger of a word-based and a character-based estimate, so text
+    without spaces (minified code, URLs, base64, CJK) is not undercounted.
+    """
+
+    def __init__(self, tokens_per_word=1.3, chars_per_token=3.0):
+        self.tokens_per_word = tokens_per_word
+        self.chars_per_token = chars_per_token
+
+    def count(self, text):
+        estimate = max(len(text.split()) * self.tokens_per_word, len(text) / self.chars_per_token)
+        return int(estimate + 0.999)
+
+
+class HFTokenizerAdapter:
+    """Exact counting and slicing with a HuggingFace tokenizer"""
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+
+    def count(self, text):
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def encode(self, text):
+        return self.tokenizer.encode(text, add_special_tokens=False)
+
+    def decode(self, ids):
+        return self.tokenizer.decode(ids, skip_special_tokens=True)
+
+
+def compact_text(text, boilerplate_patterns=None):
+    """Collapse redundant whitespace, drop repeated lines and boilerplate"""
+    patterns = [re.compile(p, re.IGNORECASE) for p in
+                (boilerplate_patterns if boilerplate_patterns is not None
+                 else DEFAULT_BOILERPLATE_PATTERNS)]
+    seen = set()
+    lines = []
+    blank = False
+    for raw in text.splitlines():
+        line = re.sub(r'[ \t]+', ' ', raw).strip()
+        if not line:
+            if lines and not blank:
+                lines.append('')
+            blank = True
+            continue
+        blank = False
+        key = line.lower()
+        if key in seen or any(p.search(line) for p in patterns):
+            continue
+        seen.add(key)
+        lines.append(line)
+    return '\n'.join(lines).strip()
+
+
+class TokenBudget:
+    """Fit system message + template + input into the model's context window
+
+    The budget is context_size - max_tokens (the completion reservation),
+    optionally capped further by max_input_tokens so prefill time stays
+    bounded even on large-context models.
+    """
+
+    def __init__(self, context_size=2048, policy='truncate_tail', compact=True,
+                 max_input_tokens=None, tokenizer=None, boilerplate_patterns=None,
+                 truncation_marker=' [...] '):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown truncation policy '{policy}', expected one of {POLICIES}")
+        self.context_size = context_size
+        self.policy = policy
+        self.compact = compact
+        self.max_input_tokens = max_input_tokens
+        self.tokenizer = tokenizer or ApproximateTokenizer()
+        self.boilerplate_patterns = boilerplate_patterns
+        self.truncation_marker = truncation_marker
+
+    @classmethod
+    def from_config(cls, config, tokenizer=None):
+        """Build a budget from the 'token_budget' section of config.json"""
+        config = config or {}
+        return cls(
+            context_size=config.get('context_size', 2048),
+            policy=config.get('policy', 'truncate_tail'),
+            compact=config.get('compact', True),
+            max_input_tokens=config.get('max_input_tokens'),
+            tokenizer=tokenizer,
+            boilerplate_patterns=config.get('boilerplate_patterns'),
+        )
+
+    def count(self, text):
+        return self.tokenizer.count(text)
+
+    def available(self, max_tokens, overhead_tokens=0):
+        """Tokens left for the variable input once fixed parts are counted"""
+        limit = self.context_size - max_tokens
+        if self.max_input_tokens is not None:
+            limit = min(limit, self.max_input_tokens)
+        return limit - overhead_tokens
+
+    def overhead(self, system_msg='', user_template='{input}'):
+        """Tokens taken by the system message and template around {input}"""
+        overhead_text = user_template.replace('{input}', '')
+        if system_msg:
+            overhead_text = f"{system_msg}\n\n{overhead_text}"
+        return self.count(overhead_text)
+
+    def fit(self, user_input, max_tokens, system_msg='', user_template='{input}'):
+        """Return (fitted_input, report) so the rendered prompt fits the budget"""
+        overhead = self.overhead(system_msg, user_template)
+        allowed = self.available(max_tokens, overhead)
+        original_tokens = self.count(user_input)
+
+        report = {
+            'context_size': self.context_size,
+            'reserved_completion_tokens': max_tokens,
+            'overhead_tokens': overhead,
+            'input_budget': max(allowed, 0),
+            'original_input_tokens': original_tokens,
+            'compacted': False,
+            'truncated': False,
+            'policy': self.policy,
+        }
+
+        if allowed <= 0:
+            raise ContextOverflowError(
+                f"No room for input: {overhead} prompt tokens + {max_tokens} completion tokens "
+                f"exceed the {self.context_size}-token context")
+
+        text = user_input
+        if original_tokens > allowed and self.compact:
+            text = compact_text(text, self.boilerplate_patterns)
+            report['compacted'] = text != user_input
+
+        tokens = self.count(text)
+        if tokens > allowed:
+            if self.policy == 'reject':
+                raise ContextOverflowError(
+                    f"Input is {tokens} tokens but only {allowed} fit "
+                    f"(context {self.context_size}, reserved {max_tokens}, prompt overhead {overhead})")
+            text = self._truncate(text, allowed)
+            report['truncated'] = True
+            tokens = self.count(text)
+
+        report['input_tokens'] = tokens
+        report['prompt_tokens'] = overhead + tokens
+        return text, report
+
+    def fit_prompt(self, prompt, max_tokens):
+        """Fit an already-rendered prompt (no separate template/system parts)"""
+        return self.fit(prompt, max_tokens)
+
+    def split(self, text, chunk_tokens, overlap_tokens=0):
+        """Cut text into chunks of at most chunk_tokens, each repeating the
+        last overlap_tokens of the previous one so no sentence is lost at a boundary"""
+        overlap_tokens = min(overlap_tokens, chunk_tokens // 2)
+        if hasattr(self.tokenizer, 'encode'):
+            ids = self.tokenizer.encode(text)
+            step = chunk_tokens - overlap_tokens
+            return [self.tokenizer.decode(ids[start:start + chunk_tokens])
+                    for start in range(0, max(len(ids) - overlap_tokens, 1), step)]
+
+        # Word boundaries with the same largest-fitting-slice search as _truncate;
+        # a piece is about one token or more, so a chunk never spans many more than chunk_tokens pieces
+        words = _PIECE.findall(text)
+        chunks = []
+        start = 0
+        while start < len(words):
+            low, high = start + 1, min(start + 2 * chunk_tokens, len(words))
+            while low < high:
+                mid = (low + high + 1) // 2
+                if self.count(''.join(words[start:mid])) <= chunk_tokens:
+                    low = mid
+                else:
+                    high = mid - 1
+            chunks.append(''.join(words[start:low]).strip())
+            if low >= len(words):
+                break
+            back = low
+            while back > start + 1 and self.count(''.join(words[back - 1:low])) <= overlap_tokens:
+                back -= 1
+            start = max(back, start + 1)
+        return chunks
+
+    def _truncate(self, text, allowed):
+        marker_tokens = self.count(self.truncation_marker) if self.policy == 'truncate_middle' else 0
+        allowed = max(allowed - marker_tokens, 1)
+        if hasattr(self.tokenizer, 'encode'):
+            ids = self.tokenizer.encode(text)
+            return self._join(ids, allowed, self.tokenizer.decode)
+        # No real tokenizer: slice on word boundaries, searching for the
+        # largest slice whose estimate still fits.
+        words = _PIECE.findall(text)
+        low, high = 0, len(words)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.count(self._join(words, mid, ''.join)) <= allowed + marker_tokens:
+                low = mid
+            else:
+                high = mid - 1
+        return self._join(words, low, ''.join).strip()
+
+    def _join(self, parts, keep, join):
+        if self.policy == 'truncate_tail':
+            return join(parts[:keep])
+        if self.policy == 'truncate_head':
+            return join(parts[len(parts) - keep:]) if keep else ''
+        head = (keep + 1) // 2
+        tail = keep - head
+        tail_part = join(parts[len(parts) - tail:]) if tail else ''
+        return f"{join(parts[:head])}{self.truncation_marker}{tail_part}"
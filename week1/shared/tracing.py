@@ -0,0 +1,228 @@
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Upper bounds (seconds) for the Prometheus histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class Tracer:
+    """Collects per-phase spans for the generation path
+
+    Spans are kept in memory and can be exported as Chrome trace JSON
+    (chrome://tracing, Perfetto) or Prometheus text-format metrics. A
+    disabled tracer still runs the wrapped code but records nothing.
+    """
+
+    def __init__(self, enabled=True, service='genai', buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.service = service
+        self.buckets = buckets
+        self.spans = []
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    @classmethod
+    def from_config(cls, config):
+        """Build a tracer from the 'tracing' section of config.json"""
+        config = config or {}
+        return cls(enabled=config.get('enabled', False), service=config.get('service', 'genai'))
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """Time the enclosed block as one span; attrs can be added while it runs"""
+        if not self.enabled:
+            yield attrs
+            return
+        start = time.perf_counter()
+        try:
+            yield attrs
+        finally:
+            self.record(name, start, time.perf_counter(), **attrs)
+
+    def record(self, name, start, end, **attrs):
+        """Record a span from perf_counter timestamps measured by the caller"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.spans.append({
+                'name': name,
+                'start': start,
+                'duration': end - start,
+                'pid': os.getpid(),
+                'tid': threading.get_ident(),
+                'attrs': attrs,
+            })
+
+    def reset(self):
+        with self._lock:
+            self.spans = []
+
+    def summary(self):
+        """Count, total and mean seconds per span name"""
+        stats = {}
+        for span in self.spans:
+            entry = stats.setdefault(span['name'], {'count': 0, 'total_time': 0.0, 'max_time': 0.0})
+            entry['count'] += 1
+            entry['total_time'] += span['duration']
+            entry['max_time'] = max(entry['max_time'], span['duration'])
+        for entry in stats.values():
+            entry['avg_time'] = entry['total_time'] / entry['count']
+        return stats
+
+    def chrome_trace(self):
+        """Spans as a Chrome trace event document"""
+        events = []
+        for span in self.spans:
+            events.append({
+                'name': span['name'],
+                'cat': self.service,
+                'ph': 'X',
+                'ts': (span['start'] - self._origin) * 1e6,
+                'dur': span['duration'] * 1e6,
+                'pid': span['pid'],
+                'tid': span['tid'],
+                'args': {k: v for k, v in span['attrs'].items() if isinstance(v, (str, int, float, bool))},
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export_chrome_trace(self, path):
+        _ensure_parent(path)
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+        print(f"📈 Chrome trace written to {path}")
+        return path
+
+    def prometheus_text(self):
+        """Span durations as a Prometheus histogram in text exposition format"""
+        metric = f"{self.service}_phase_duration_seconds"
+        lines = [
+            f"# HELP {metric} Time spent in each generation phase.",
+            f"# TYPE {metric} histogram",
+        ]
+        by_name = {}
+        for span in self.spans:
+            by_name.setdefault(span['name'], []).append(span['duration'])
+        for name in sorted(by_name):
+            durations = by_name[name]
+            for bound in self.buckets:
+                count = sum(1 for d in durations if d <= bound)
+                lines.append(f'{metric}_bucket{{phase="{name}",le="{bound}"}} {count}')
+            lines.append(f'{metric}_bucket{{phase="{name}",le="+Inf"}} {len(durations)}')
+            lines.append(f'{metric}_sum{{phase="{name}"}} {sum(durations):.6f}')
+            lines.append(f'{metric}_count{{phase="{name}"}} {len(durations)}')
+        return "\n".join(lines) + "\n"
+
+    def export_prometheus(self, path):
+        _ensure_parent(path)
+        with open(path, 'w') as f:
+            f.write(self.prometheus_text())
+        print(f"📈 Prometheus metrics written to {path}")
+        return path
+
+    @contextmanager
+    def profile(self, path, mode='sampling', interval=0.005):
+        """Profile the enclosed block with cProfile or the stack sampler
+
+        'cprofile' writes a .prof file for pstats/snakeviz; 'sampling' writes
+        collapsed stacks (the format py-spy emits with --format raw) that
+        flamegraph.pl and speedscope read directly.
+        """
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield profiler
+            finally:
+                profiler.disable()
+                _ensure_parent(path)
+                profiler.dump_stats(path)
+                print(f"🔬 cProfile stats written to {path}")
+        elif mode == 'sampling':
+            sampler = StackSampler(interval=interval)
+            sampler.start()
+            try:
+                yield sampler
+            finally:
+                sampler.stop()
+                sampler.write_collapsed(path)
+                print(f"🔬 Sampled stacks written to {path}")
+        else:
+            raise ValueError(f"Unknown profile mode '{mode}', expected 'cprofile' or 'sampling'")
+
+
+class StackSampler:
+    """Low-overhead wall-clock sampler for the calling thread"""
+
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.thread_id is None:
+            self.thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def write_collapsed(self, path):
+        _ensure_parent(path)
+        with open(path, 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+def timed_stream(tracer, stream, start=None, on_token=None):
+    """Consume a token stream, recording prefill (to first token) and decode spans
+
+    on_token, if given, is called with each piece as it arrives.
+
+    Returns (text, generated_token_count, prefill_seconds, decode_seconds).
+    """
+    start = start if start is not None else time.perf_counter()
+    pieces = []
+    first_token_at = None
+    for piece in stream:
+        if first_token_at is None:
+            first_token_at = time.perf_counter()
+            tracer.record('prefill', start, first_token_at)
+        pieces.append(piece)
+        if on_token:
+            on_token(piece)
+    end = time.perf_counter()
+    if first_token_at is None:
+        tracer.record('prefill', start, end)
+        return ''.join(pieces), 0, end - start, 0.0
+    tracer.record('decode', first_token_at, end, tokens=len(pieces))
+    return ''.join(pieces), len(pieces), first_token_at - start, end - first_token_at
+
+
+def _ensure_parent(path):
+    parent = os.path.dirname(path)
+    if parent and not os.path.exists(parent):
+        os.makedirs(parent)